@@ -6,10 +6,10 @@ import json
 import structlog
 from typing import Any
 
-from langchain_openai import ChatOpenAI
 from langchain_core.messages import HumanMessage, SystemMessage
 
-from ..config import settings
+from ..llm import get_chat_model, invoke_structured
+from ..models.schemas import OfferRecommendation
 from ..platforms.ebay import EbayAdapter
 from ..platforms.vinted import VintedAdapter
 
@@ -34,11 +34,7 @@ Respond as JSON: {"recommendation": "accept|decline|counter", "counter_price": n
 
 async def _auto_reply_message(item_data: dict, message_content: str) -> str:
     """Generate an automatic reply to a buyer question."""
-    llm = ChatOpenAI(
-        model="gpt-4o-mini",
-        api_key=settings.OPENAI_API_KEY,
-        temperature=0.3,
-    )
+    llm = get_chat_model("gpt-4o-mini", temperature=0.3)
     messages = [
         SystemMessage(content=AUTO_REPLY_SYSTEM_PROMPT),
         HumanMessage(content=json.dumps({
@@ -57,11 +53,7 @@ async def _analyse_offer(
     item_data: dict,
 ) -> dict:
     """Ask the LLM for an offer recommendation."""
-    llm = ChatOpenAI(
-        model="gpt-4o-mini",
-        api_key=settings.OPENAI_API_KEY,
-        temperature=0,
-    )
+    llm = get_chat_model("gpt-4o-mini", temperature=0)
     messages = [
         SystemMessage(content=OFFER_ANALYSIS_PROMPT),
         HumanMessage(content=json.dumps({
@@ -71,17 +63,10 @@ async def _analyse_offer(
             "item": item_data,
         })),
     ]
-    response = await llm.ainvoke(messages)
-    raw = response.content.strip()
-    if raw.startswith("```"):
-        raw = raw.split("```", 2)[1]
-        if raw.startswith("json"):
-            raw = raw[4:]
-        raw = raw.rsplit("```", 1)[0].strip()
-    try:
-        return json.loads(raw)
-    except json.JSONDecodeError:
-        return {"recommendation": "counter", "counter_price": None, "reasoning": response.content}
+    result = await invoke_structured(llm, messages, OfferRecommendation)
+    if result.value is None:
+        return {"recommendation": "counter", "counter_price": None, "reasoning": result.raw}
+    return result.value
 
 
 async def run_deal_manager(state: dict[str, Any]) -> dict[str, Any]:
@@ -2,13 +2,27 @@
 Intake Agent — analyses photos and user description using GPT-4o vision
 to produce a structured item profile.
 
+Results are cached by (image content hashes, description, prompt version), so
+re-running an item with the same photos skips the LLM entirely. A text-only
+result is only cached when there were no usable images; otherwise it is a
+fallback and the next run tries vision again.
+
 Fallback strategy:
 1. Try vision (image + description).
 2. If OpenAI refuses or vision fails, retry with text-only using the description.
 3. If no description either, build a minimal placeholder so the pipeline continues.
+
+With INTAKE_HEDGE=true and a description present, steps 1 and 2 are hedged:
+the text-only request starts INTAKE_HEDGE_DELAY_S after vision (0 = together;
+the default sits near vision p90 latency, so only the slow tail is hedged),
+vision wins if it succeeds within INTAKE_VISION_DEADLINE_S, otherwise the text
+result is used and the losing request is cancelled. A text result that won on
+the deadline is never cached: a one-off slow vision call must not turn into a
+week-long downgrade of that item's analysis.
 """
-import base64
 import json
+import asyncio
+import hashlib
 import structlog
 from pathlib import Path
 from typing import Any
@@ -17,6 +31,12 @@ from langchain_openai import ChatOpenAI
 from langchain_core.messages import HumanMessage, SystemMessage
 
 from ..config import settings
+from ..llm import get_chat_model, invoke_structured
+from ..models.schemas import IntakeItemData
+from ..storage import derivative_key
+from ..images import prepare_vision_images
+from ..cache import make_cache
+from .listing import start_comparables_prefetch
 
 log = structlog.get_logger()
 
@@ -50,6 +70,11 @@ Based on the user's description below, extract a structured item profile:
 
 Respond ONLY with valid JSON matching the schema above. No markdown, no explanation."""
 
+# Changes whenever a prompt changes, so stale cached analyses are never reused
+PROMPT_VERSION = hashlib.sha256((SYSTEM_PROMPT + TEXT_ONLY_PROMPT).encode()).hexdigest()[:12]
+
+_result_cache = make_cache("intake", settings.INTAKE_CACHE_MAX_ENTRIES)
+
 # Phrases that indicate a content policy refusal
 _REFUSAL_PHRASES = [
     "i'm sorry",
@@ -69,18 +94,102 @@ def _is_refusal(text: str) -> bool:
     return any(phrase in lower for phrase in _REFUSAL_PHRASES)
 
 
-def _parse_json(raw: str) -> dict | None:
-    """Strip markdown fences and parse JSON. Returns None on failure."""
-    if raw.startswith("```"):
-        raw = raw.split("```", 2)[1]
-        if raw.startswith("json"):
-            raw = raw[4:]
-        raw = raw.rsplit("```", 1)[0]
-        raw = raw.strip()
+def _file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(1024 * 1024):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+async def _cache_key(local_paths: list[str], user_description: str) -> str:
+    """Order-independent key over image contents, description and prompt version."""
+    hashes = await asyncio.gather(*(asyncio.to_thread(_file_sha256, p) for p in local_paths))
+    payload = json.dumps({
+        "images": sorted(hashes),
+        "description": user_description.strip(),
+        "prompt": PROMPT_VERSION,
+    })
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+async def _vision_intake(llm: ChatOpenAI, content: list[dict]) -> tuple[dict | None, str]:
+    """Returns (item_data, "vision"); item_data is None on refusal or failure."""
+    try:
+        messages = [
+            SystemMessage(content=SYSTEM_PROMPT),
+            HumanMessage(content=content),
+        ]
+        result = await invoke_structured(llm, messages, IntakeItemData, is_refusal=_is_refusal)
+
+        if result.refused:
+            log.warning("intake.vision_refused", reason=result.raw[:120])
+            return None, "vision"
+        if result.value is None:
+            log.warning("intake.vision_parse_failed", raw=result.raw[:120])
+        return result.value, "vision"
+    except Exception as e:
+        log.warning("intake.vision_error", error=str(e))
+        return None, "vision"
+
+
+async def _text_intake(llm: ChatOpenAI, user_description: str) -> tuple[dict | None, str]:
+    """Returns (item_data, "text"); item_data is None on failure."""
+    try:
+        messages = [
+            SystemMessage(content=TEXT_ONLY_PROMPT),
+            HumanMessage(content=f"User description: {user_description}"),
+        ]
+        result = await invoke_structured(llm, messages, IntakeItemData)
+        if result.value is None:
+            log.error("intake.text_parse_failed", raw=result.raw[:200])
+        return result.value, "text"
+    except Exception as e:
+        log.error("intake.text_error", error=str(e))
+        return None, "text"
+
+
+async def _hedged_intake(
+    llm: ChatOpenAI, content: list[dict], user_description: str
+) -> tuple[dict | None, str | None]:
+    """
+    Race vision against a delayed text-only request.
+    Vision is preferred if it succeeds before the deadline; otherwise the text
+    result is used. Whichever request is not needed is cancelled.
+    Returns (item_data, source) with source "vision", "text", "text_deadline"
+    (text used because vision missed the deadline) or None.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + settings.INTAKE_VISION_DEADLINE_S
+    vision = asyncio.create_task(_vision_intake(llm, content))
+    text: asyncio.Task | None = None
     try:
-        return json.loads(raw)
-    except json.JSONDecodeError:
-        return None
+        await asyncio.wait({vision}, timeout=settings.INTAKE_HEDGE_DELAY_S)
+        if vision.done() and vision.result()[0] is not None:
+            return vision.result()
+
+        log.info("intake.hedge_text_started", vision_done=vision.done())
+        text = asyncio.create_task(_text_intake(llm, user_description))
+        if not vision.done():
+            await asyncio.wait({vision}, timeout=max(0.0, deadline - loop.time()))
+        if vision.done() and vision.result()[0] is not None:
+            log.info("intake.hedge_winner", winner="vision")
+            return vision.result()
+
+        vision_timed_out = not vision.done()
+        item_data, source = await text
+        if item_data is None and not vision.done():
+            # Text failed too — vision is still our best chance
+            item_data, source = await vision
+        elif item_data is not None and vision_timed_out:
+            source = "text_deadline"
+        source = source if item_data is not None else None
+        log.info("intake.hedge_winner", winner=source)
+        return item_data, source
+    finally:
+        for task in (vision, text):
+            if task is not None and not task.done():
+                task.cancel()
 
 
 async def run_intake(state: dict[str, Any]) -> dict[str, Any]:
@@ -94,74 +203,72 @@ async def run_intake(state: dict[str, Any]) -> dict[str, Any]:
 
     log.info("intake.start", images=len(image_paths), has_description=bool(user_description))
 
-    llm = ChatOpenAI(
-        model="gpt-4o",
-        api_key=settings.OPENAI_API_KEY,
-        temperature=0,
-    )
+    if user_description and settings.COMPARABLES_PREFETCH and state.get("item_id") is not None:
+        start_comparables_prefetch(state["item_id"], user_description, state.get("platforms", ["ebay"]))
+
+    llm = get_chat_model("gpt-4o", temperature=0)
+
+    local_paths: list[str] = []
+    for path_str in image_paths:
+        path = Path(path_str)
+        if not path.exists():
+            log.warning("intake.image_not_found", path=path_str)
+            continue
+        # Prefer the downsized, orientation-normalised vision derivative
+        vision_path = Path(derivative_key(path_str, "vision"))
+        local_paths.append(str(vision_path if vision_path.exists() else path))
 
     # ------------------------------------------------------------------
-    # Step 1: Try vision if we have images
+    # Step 0: Reuse a cached analysis of the same photos + description
     # ------------------------------------------------------------------
-    item_data = None
+    cache_key = None
+    if settings.INTAKE_CACHE_ENABLED and (local_paths or user_description):
+        cache_key = await _cache_key(local_paths, user_description)
+        cached = await _result_cache.get(cache_key)
+        if cached is not None:
+            log.info("intake.cache_hit", title=cached.get("title"))
+            return {**state, "step": "listing", "item_data": cached}
 
+    # ------------------------------------------------------------------
+    # Step 1: Try vision if we have images
+    # ------------------------------------------------------------------
+    content: list[dict] = []
     if image_paths:
-        content: list[dict] = []
         if user_description:
             content.append({"type": "text", "text": f"User description: {user_description}"})
 
-        images_loaded = 0
-        for path_str in image_paths:
-            path = Path(path_str)
-            if not path.exists():
-                log.warning("intake.image_not_found", path=path_str)
-                continue
-            with open(path, "rb") as f:
-                b64 = base64.b64encode(f.read()).decode()
-            suffix = path.suffix.lower().lstrip(".")
-            mime = {"jpg": "image/jpeg", "jpeg": "image/jpeg", "png": "image/png", "webp": "image/webp"}.get(suffix, "image/jpeg")
+        # Downscale, drop near-duplicates and keep the sharpest photos;
+        # the best few go at detail=high, the rest at detail=low. Only the
+        # kept photos are encoded (in the image worker pool), so one data URL
+        # per kept photo is held here.
+        for image in await prepare_vision_images(local_paths):
             content.append({
                 "type": "image_url",
-                "image_url": {"url": f"data:{mime};base64,{b64}", "detail": "high"},
+                "image_url": {"url": image["data_url"], "detail": image["detail"]},
             })
-            images_loaded += 1
 
+    item_data, source = None, None
+    if content and user_description and settings.INTAKE_HEDGE:
+        item_data, source = await _hedged_intake(llm, content, user_description)
+    else:
         if content:
-            try:
-                messages = [
-                    SystemMessage(content=SYSTEM_PROMPT),
-                    HumanMessage(content=content),
-                ]
-                response = await llm.ainvoke(messages)
-                raw = response.content.strip()
-
-                if _is_refusal(raw):
-                    log.warning("intake.vision_refused", reason=raw[:120])
-                else:
-                    item_data = _parse_json(raw)
-                    if item_data is None:
-                        log.warning("intake.vision_parse_failed", raw=raw[:120])
-
-            except Exception as e:
-                log.warning("intake.vision_error", error=str(e))
+            item_data, source = await _vision_intake(llm, content)
 
-    # ------------------------------------------------------------------
-    # Step 2: Fall back to text-only if vision failed or was refused
-    # ------------------------------------------------------------------
-    if item_data is None and user_description:
-        log.info("intake.fallback_text_only")
-        try:
-            messages = [
-                SystemMessage(content=TEXT_ONLY_PROMPT),
-                HumanMessage(content=f"User description: {user_description}"),
-            ]
-            response = await llm.ainvoke(messages)
-            raw = response.content.strip()
-            item_data = _parse_json(raw)
-            if item_data is None:
-                log.error("intake.text_parse_failed", raw=raw[:200])
-        except Exception as e:
-            log.error("intake.text_error", error=str(e))
+        # --------------------------------------------------------------
+        # Step 2: Fall back to text-only if vision failed or was refused
+        # --------------------------------------------------------------
+        if item_data is None and user_description:
+            log.info("intake.fallback_text_only")
+            item_data, source = await _text_intake(llm, user_description)
+
+    # A text-only result with usable photos is a fallback (vision refused,
+    # failed or timed out) — don't pin it for the whole cache TTL.
+    has_images = any(c["type"] == "image_url" for c in content)
+    if item_data is not None and cache_key:
+        if source == "vision" or (source == "text" and not has_images):
+            await _result_cache.set(cache_key, item_data, ttl=settings.INTAKE_CACHE_TTL_HOURS * 3600)
+        else:
+            log.info("intake.cache_skipped", source=source)
 
     # ------------------------------------------------------------------
     # Step 3: Last resort — minimal placeholder so pipeline continues
@@ -1,29 +1,60 @@
 """
 Listing Agent — generates platform-optimised listing copy and suggests a price
 based on sold comparables fetched from each target platform.
+
+Copy and price are independent, so they are separate graph branches that run
+concurrently (run_copywriting, run_pricing) and join in run_listing. When no
+priced comparable comes back, the pricing branch asks the LLM for a price from
+the item data alone, so the item never reaches approval without one.
+
+Copy is requested only for the target platforms: the prompt and output schema
+are assembled from per-platform templates (models.schemas.PLATFORM_COPY_SCHEMAS).
+Platforms added at approval time get their copy from the publisher, on demand.
+While the copy is generated, the proposed_description is streamed to the item's
+websocket in throttled chunks; the validated result is what gets persisted.
+
+When the user gave a description, the intake node starts a speculative
+comparables search from it (start_comparables_prefetch), so the platform
+lookups overlap the vision call instead of following it.
+
+Each platform is answered from the local comparables warehouse when it holds
+enough fresh full-text matches. Otherwise the platform is searched through a
+cache shared across items and users (stale-while-revalidate, Redis when
+REDIS_URL is set) keyed by normalised query, platform and marketplace, and
+the results are added to the warehouse.
 """
+import re
 import json
-import statistics
+import time
+import asyncio
 import structlog
+from dataclasses import asdict
+from functools import lru_cache
 from typing import Any
 
-from langchain_openai import ChatOpenAI
 from langchain_core.messages import HumanMessage, SystemMessage
+from pydantic import BaseModel, create_model
 
 from ..config import settings
+from ..cache import make_cache, StaleWhileRevalidate
+from ..comparables_store import search_comparables, store_comparables
+from ..llm import get_chat_model, invoke_structured
+from ..pricing import PriceEstimate, price_item
+from ..models.schemas import FallbackPrice, MasterCopy, PLATFORM_COPY_SCHEMAS
 from ..platforms.ebay import EbayAdapter
 from ..platforms.vinted import VintedAdapter
 
 log = structlog.get_logger()
 
-LISTING_SYSTEM_PROMPT = """You are an expert copywriter for second-hand selling platforms.
-Given structured item data and a list of comparable sold listings, generate:
-- proposed_description: a clear, honest, buyer-friendly item description (plain text, 3-5 sentences). This is the master description the seller will review and edit before publishing.
-- ebay_title: eBay-optimised title (keyword-rich, max 80 chars)
-- ebay_description: eBay listing description (HTML allowed, 2-4 paragraphs, based on proposed_description)
-- vinted_title: Vinted-optimised title (casual, friendly, max 60 chars)
-- vinted_description: Vinted description (conversational, 1-2 paragraphs, based on proposed_description)
-- suggested_price: recommended asking price in EUR based on comparables
+LISTING_PROMPT_HEAD = """You are an expert copywriter for second-hand selling platforms.
+Given structured item data (and the approved proposed_description, when provided), generate:"""
+
+LISTING_PROMPT_TAIL = "Respond ONLY with valid JSON. No markdown, no explanation."
+
+FALLBACK_PRICE_PROMPT = """You are an expert second-hand goods appraiser.
+No comparable sold listings could be found for the item below. From the item
+data alone, give:
+- suggested_price: recommended asking price in EUR, or null if you cannot tell
 - price_rationale: brief explanation of the price recommendation
 
 Respond ONLY with valid JSON. No markdown, no explanation."""
@@ -35,124 +66,453 @@ PLATFORM_ADAPTERS = {
 }
 
 
-async def _fetch_comparables(item_data: dict, platforms: list[str]) -> list[dict]:
-    """Fetch sold comparables from all target platforms."""
+# Words that carry no signal in a marketplace search
+_QUERY_STOPWORDS = {
+    "a", "an", "and", "the", "of", "for", "with", "in", "on", "to", "my", "is", "it", "this",
+    "that", "i", "im", "selling", "sell", "used", "size", "very", "good", "great", "condition",
+    "worn", "only", "once", "like", "new", "item", "some", "has", "have", "was", "are",
+}
+_QUERY_MAX_WORDS = 5
+
+# item_id → (query, task) for comparables searches started while intake runs
+_prefetches: dict[int, tuple[str, asyncio.Task]] = {}
+
+
+def _tokens(text: str) -> set[str]:
+    return {w for w in re.findall(r"[a-z0-9]+", text.lower().replace("'", "")) if w not in _QUERY_STOPWORDS}
+
+
+def comparables_query(item_data: dict) -> str:
+    """Search query for an analysed item."""
     query = " ".join(filter(None, [
         item_data.get("brand"),
         item_data.get("model"),
         item_data.get("title", "").split()[0] if item_data.get("title") else None,
     ]))
-    if not query:
-        query = item_data.get("category", "item")
+    return query or item_data.get("category", "item")
 
-    all_comps: list[dict] = []
-    for platform_name in platforms:
-        adapter_cls = PLATFORM_ADAPTERS.get(platform_name)
-        if not adapter_cls:
+
+def description_query(description: str) -> str:
+    """Best-guess search query from the user's free-text description alone."""
+    words: list[str] = []
+    for word in re.findall(r"[A-Za-z0-9][A-Za-z0-9'\-]*", description):
+        if word.lower().replace("'", "") in _QUERY_STOPWORDS or word.lower() in (w.lower() for w in words):
             continue
+        words.append(word)
+        if len(words) >= _QUERY_MAX_WORDS:
+            break
+    return " ".join(words)
+
+
+# platform → {"calls", "timeouts", "errors"}
+comparables_stats: dict[str, dict[str, int]] = {}
+
+
+def _count(platform: str, counter: str):
+    stats = comparables_stats.setdefault(platform, {"calls": 0, "timeouts": 0, "errors": 0})
+    stats[counter] += 1
+
+
+_comparables_cache = StaleWhileRevalidate(
+    make_cache("comparables", settings.COMPARABLES_CACHE_MAX_ENTRIES),
+    ttl=settings.COMPARABLES_CACHE_TTL_HOURS * 3600,
+    stale_ttl=settings.COMPARABLES_CACHE_STALE_HOURS * 3600,
+)
+
+
+def normalize_query(query: str) -> str:
+    """
+    Case-, punctuation- and word-order-insensitive form of a search query.
+    Splits on punctuation the way the full-text indexes tokenise titles.
+    """
+    return " ".join(sorted(set(re.findall(r"[a-z0-9]+", query.lower()))))
+
+
+async def _platform_search(adapter, query: str, limit: int) -> list[dict]:
+    """Search the platform itself and add the results to the warehouse."""
+    comps = await adapter.get_sold_comparables(query, limit=limit)
+    if settings.COMPARABLES_WAREHOUSE and comps:
         try:
-            adapter = adapter_cls()
-            comps = await adapter.get_sold_comparables(query, limit=8)
-            all_comps.extend(comps)
-            log.info("listing.comparables_fetched", platform=platform_name, count=len(comps))
+            await store_comparables(comps, adapter.platform_name, adapter.marketplace)
         except Exception as e:
-            log.warning("listing.comparables_error", platform=platform_name, error=str(e))
+            log.warning("listing.warehouse_store_error", platform=adapter.platform_name, error=str(e))
+    return comps
 
-    return all_comps
 
+async def _sold_comparables(adapter, query: str) -> list[dict]:
+    """
+    One platform's comparables: from the local warehouse when it has enough
+    fresh matches, otherwise from the platform (through the shared cache),
+    topped up with whatever the warehouse had.
+    """
+    limit = settings.COMPARABLES_LIMIT
+    normalized = normalize_query(query)
 
-def _calculate_price_suggestion(comparables: list[dict], condition: str) -> float | None:
-    """Median of comp prices adjusted by condition multiplier."""
-    prices = [c["sold_price"] for c in comparables if c.get("sold_price", 0) > 0]
-    if not prices:
-        return None
+    local: list[dict] = []
+    if settings.COMPARABLES_WAREHOUSE:
+        try:
+            local = await search_comparables(normalized.split(), adapter.platform_name, adapter.marketplace, limit)
+        except Exception as e:
+            log.warning("listing.warehouse_search_error", platform=adapter.platform_name, error=str(e))
+        if len(local) >= settings.COMPARABLES_WAREHOUSE_MIN_HITS:
+            log.info("listing.warehouse_hit", platform=adapter.platform_name, count=len(local))
+            return local
 
-    median = statistics.median(prices)
+    if settings.COMPARABLES_CACHE_ENABLED:
+        key = f"{adapter.platform_name}:{adapter.marketplace}:{limit}:{normalized}"
+        fetched = await _comparables_cache.get_or_load(key, lambda: _platform_search(adapter, query, limit))
+    else:
+        fetched = await _platform_search(adapter, query, limit)
+    return _dedupe(fetched + local)[:limit]
 
-    condition_multipliers = {
-        "new": 1.0,
-        "like new": 0.90,
-        "excellent": 0.80,
-        "good": 0.70,
-        "fair": 0.55,
-        "poor": 0.35,
-    }
-    multiplier = condition_multipliers.get(condition.lower(), 0.70)
-    return round(median * multiplier, 2)
+
+async def _platform_comparables(platform_name: str, query: str) -> list[dict]:
+    adapter_cls = PLATFORM_ADAPTERS[platform_name]
+    timeout = settings.COMPARABLES_PLATFORM_TIMEOUTS.get(platform_name, settings.COMPARABLES_TIMEOUT_S)
+    _count(platform_name, "calls")
+    try:
+        adapter = adapter_cls()
+        comps = await asyncio.wait_for(_sold_comparables(adapter, query), timeout=timeout)
+        log.info("listing.comparables_fetched", platform=platform_name, count=len(comps))
+        return comps
+    except asyncio.TimeoutError:
+        _count(platform_name, "timeouts")
+        stats = comparables_stats[platform_name]
+        log.warning(
+            "listing.comparables_timeout",
+            platform=platform_name,
+            timeout=timeout,
+            timeout_rate=round(stats["timeouts"] / stats["calls"], 3),
+        )
+    except Exception as e:
+        _count(platform_name, "errors")
+        log.warning("listing.comparables_error", platform=platform_name, error=str(e))
+    return []
 
 
-async def run_listing(state: dict[str, Any]) -> dict[str, Any]:
+async def _search_comparables(query: str, platforms: list[str]) -> list[dict]:
     """
-    LangGraph node: listing.
-    Fetches comparables, generates platform copy, suggests price.
+    Query all platforms concurrently, each under its own deadline.
+    Platforms that time out or fail contribute nothing; the rest are kept.
     """
-    item_data: dict = state.get("item_data", {})
-    platforms: list[str] = state.get("platforms", ["ebay"])
+    names = [p for p in platforms if p in PLATFORM_ADAPTERS]
+    results = await asyncio.gather(*(_platform_comparables(p, query) for p in names))
+    return [c for comps in results for c in comps]
 
-    if not item_data:
-        return {**state, "errors": state.get("errors", []) + ["No item data available for listing generation"]}
 
-    log.info("listing.start", title=item_data.get("title"), platforms=platforms)
+def start_comparables_prefetch(item_id: int, description: str, platforms: list[str]):
+    """
+    Speculatively search comparables from the description while intake runs.
+    The listing node picks the result up via _fetch_comparables.
+    """
+    query = description_query(description)
+    if not query or item_id in _prefetches:
+        return
+    _prefetches[item_id] = (query, asyncio.create_task(_search_comparables(query, platforms)))
+    log.info("listing.prefetch_started", item_id=item_id, query=query)
 
-    # 1. Fetch comparables
-    comparables = await _fetch_comparables(item_data, platforms)
-    price_suggestion = _calculate_price_suggestion(comparables, item_data.get("condition", "good"))
 
-    # 2. Generate listing copy via LLM
-    llm = ChatOpenAI(
-        model="gpt-4o-mini",
-        api_key=settings.OPENAI_API_KEY,
-        temperature=0.4,
-    )
+def discard_comparables_prefetch(item_id: int):
+    """Drop a prefetch that the listing node never consumed (pipeline error, reuse)."""
+    entry = _prefetches.pop(item_id, None)
+    if entry is not None:
+        entry[1].cancel()
+
+
+def _dedupe(comps: list[dict]) -> list[dict]:
+    seen: set = set()
+    out = []
+    for c in comps:
+        key = c.get("url") or (c.get("platform"), c.get("title"), c.get("sold_price"))
+        if key not in seen:
+            seen.add(key)
+            out.append(c)
+    return out
 
-    prompt_data = {
-        "item": item_data,
-        "comparables": comparables[:10],
-        "price_suggestion_from_comps": price_suggestion,
-        "target_platforms": platforms,
-    }
 
+async def _fetch_comparables(item_data: dict, platforms: list[str], item_id: int | None = None) -> list[dict]:
+    """
+    Fetch sold comparables from all target platforms.
+    If a prefetch from the description is pending for this item, its results
+    are reused when its query matches the analysed item's query, or filtered
+    to titles sharing a query word (topped up with a fresh search) otherwise.
+    """
+    query = comparables_query(item_data)
+    entry = _prefetches.pop(item_id, None) if item_id is not None else None
+    if entry is None:
+        return await _search_comparables(query, platforms)
+
+    spec_query, task = entry
+    try:
+        prefetched = await task
+    except Exception as e:
+        log.warning("listing.prefetch_error", error=str(e))
+        return await _search_comparables(query, platforms)
+
+    final_tokens, spec_tokens = _tokens(query), _tokens(spec_query)
+    overlap = len(final_tokens & spec_tokens) / max(1, len(final_tokens | spec_tokens))
+    if final_tokens <= spec_tokens or overlap >= settings.COMPARABLES_PREFETCH_MIN_OVERLAP:
+        log.info("listing.prefetch_hit", query=query, prefetch_query=spec_query, count=len(prefetched))
+        return prefetched
+
+    refined = [c for c in prefetched if final_tokens & _tokens(c.get("title", ""))]
+    if len(refined) >= settings.COMPARABLES_LIMIT // 2 * max(1, len(platforms)):
+        log.info("listing.prefetch_refined", query=query, prefetch_query=spec_query, kept=len(refined))
+        return refined
+
+    log.info("listing.prefetch_miss", query=query, prefetch_query=spec_query, kept=len(refined))
+    return _dedupe(refined + await _search_comparables(query, platforms))
+
+
+async def _fallback_price(item_data: dict) -> dict | None:
+    """LLM price from the item data alone, for when comparables gave no estimate."""
+    llm = get_chat_model("gpt-4o-mini", temperature=0)
     messages = [
-        SystemMessage(content=LISTING_SYSTEM_PROMPT),
-        HumanMessage(content=json.dumps(prompt_data, indent=2)),
+        SystemMessage(content=FALLBACK_PRICE_PROMPT),
+        HumanMessage(content=json.dumps(item_data, indent=2)),
     ]
+    try:
+        result = await invoke_structured(llm, messages, FallbackPrice)
+    except Exception as e:
+        log.warning("listing.fallback_price_error", error=str(e))
+        return None
+    if result.value is None or not result.value.get("suggested_price"):
+        return None
+    return result.value
+
+
+def _price_rationale(estimate: PriceEstimate | None) -> str:
+    if estimate is None:
+        return "No priced comparable sales found"
+    text = (
+        f"Weighted median of {estimate.comps_used} comparable sales, adjusted for condition "
+        f"(95% range €{estimate.low:.2f}–€{estimate.high:.2f})"
+    )
+    if estimate.outliers:
+        text += f"; {estimate.outliers} outlier{'s' if estimate.outliers > 1 else ''} excluded"
+    return text
 
-    response = await llm.ainvoke(messages)
-    raw = response.content.strip()
 
-    if raw.startswith("```"):
-        raw = raw.split("```", 2)[1]
-        if raw.startswith("json"):
-            raw = raw[4:]
-        raw = raw.rsplit("```", 1)[0].strip()
+@lru_cache(maxsize=None)
+def _copy_schema(platforms: tuple[str, ...], with_master: bool) -> type[BaseModel]:
+    """One schema holding only the copy fields of `platforms` (+ the master description)."""
+    parts = ([MasterCopy] if with_master else []) + [PLATFORM_COPY_SCHEMAS[p] for p in platforms]
+    fields = {name: (f.annotation, f) for part in parts for name, f in part.model_fields.items()}
+    return create_model("ListingCopy", **fields)
 
+
+def _copy_prompt(schema: type[BaseModel]) -> str:
+    lines = [f"- {name}: {f.description}" for name, f in schema.model_fields.items()]
+    return "\n".join([LISTING_PROMPT_HEAD, *lines, "", LISTING_PROMPT_TAIL])
+
+
+_JSON_ESCAPES = {"n": "\n", "t": "\t", "r": "\r", "b": "\b", "f": "\f"}
+
+
+def _partial_json_string(raw: str, key: str) -> str:
+    """Decoded value of string field `key` in a possibly truncated JSON text."""
+    m = re.search(r'"%s"\s*:\s*"' % re.escape(key), raw)
+    if not m:
+        return ""
+    out: list[str] = []
+    i = m.end()
+    while i < len(raw):
+        c = raw[i]
+        if c == '"':
+            break
+        if c == "\\":
+            if i + 1 >= len(raw):
+                break  # escape cut off mid-stream
+            nxt = raw[i + 1]
+            if nxt == "u":
+                if i + 6 > len(raw):
+                    break
+                out.append(chr(int(raw[i + 2:i + 6], 16)))
+                i += 6
+                continue
+            out.append(_JSON_ESCAPES.get(nxt, nxt))
+            i += 2
+            continue
+        out.append(c)
+        i += 1
+    return "".join(out)
+
+
+def _utf16_len(text: str) -> int:
+    """Length in UTF-16 code units, the unit JavaScript strings are indexed in."""
+    return len(text.encode("utf-16-le", "surrogatepass")) // 2
+
+
+class _DescriptionStream:
+    """
+    Pushes the growing proposed_description to the item's websocket as
+    `proposed_description` chunks, at most LISTING_STREAM_FPS frames per second.
+    `offset` is in UTF-16 code units so the client can splice with
+    `text.slice(0, offset) + chunk` even when the description contains emoji.
+    """
+
+    def __init__(self, item_id: int):
+        # Imported here: the api package imports the graph, which imports this module
+        from ..api.websocket import manager
+
+        self._broadcast = manager.broadcast
+        self.item_id = item_id
+        self._parts: list[str] = []
+        self._sent = ""
+        self._last = 0.0
+        self._interval = 1.0 / max(0.1, settings.LISTING_STREAM_FPS)
+
+    async def feed(self, delta: str):
+        self._parts.append(delta)
+        now = time.monotonic()
+        if now - self._last >= self._interval:
+            self._last = now
+            await self._flush(done=False)
+
+    async def close(self):
+        await self._flush(done=True)
+
+    async def _flush(self, done: bool):
+        text = _partial_json_string("".join(self._parts), "proposed_description")
+        if not text.startswith(self._sent):
+            return  # never happens for a well-formed stream; don't send garbage
+        chunk = text[len(self._sent):]
+        if not chunk and not done:
+            return
+        await self._broadcast(str(self.item_id), {
+            "type": "proposed_description",
+            "item_id": self.item_id,
+            "offset": _utf16_len(self._sent),
+            "chunk": chunk,
+            "done": done,
+        })
+        self._sent = text
+
+
+async def generate_copy(
+    item_data: dict,
+    platforms: list[str],
+    proposed_description: str | None = None,
+    item_id: int | None = None,
+) -> dict:
+    """
+    Listing copy for `platforms` only. Without a proposed_description the master
+    description is generated too; with one (e.g. at publish time, for a platform
+    added after approval) the platform copy is based on it.
+    With an item_id, a generated master description is streamed to the item's
+    websocket while it is written.
+    """
+    targets = tuple(sorted({p for p in platforms if p in PLATFORM_COPY_SCHEMAS}))
+    with_master = not proposed_description
+    if not targets and not with_master:
+        return {}
+
+    schema = _copy_schema(targets, with_master)
+    payload: dict[str, Any] = {"item": item_data, "target_platforms": list(targets)}
+    if proposed_description:
+        payload["proposed_description"] = proposed_description
+
+    llm = get_chat_model("gpt-4o-mini", temperature=0.4)
+    messages = [
+        SystemMessage(content=_copy_prompt(schema)),
+        HumanMessage(content=json.dumps(payload, indent=2)),
+    ]
+    stream = _DescriptionStream(item_id) if with_master and item_id is not None and settings.LISTING_STREAM else None
     try:
-        listing_copy = json.loads(raw)
-    except json.JSONDecodeError:
-        log.error("listing.json_parse_error", raw=raw[:200])
-        listing_copy = {
-            "ebay_title": item_data.get("title", "Item for sale"),
-            "ebay_description": item_data.get("title", ""),
-            "vinted_title": item_data.get("title", "Item for sale"),
-            "vinted_description": item_data.get("title", ""),
-            "suggested_price": price_suggestion or 0,
-            "price_rationale": "Based on comparable listings",
-        }
+        result = await invoke_structured(llm, messages, schema, on_text=stream.feed if stream else None)
+    finally:
+        if stream is not None:
+            await stream.close()
+    if result.value is not None:
+        return result.value
+
+    log.error("listing.json_parse_error", raw=result.raw[:200], platforms=list(targets))
+    title = item_data.get("title", "Item for sale")
+    fallback: dict[str, Any] = {}
+    for p in targets:
+        title_key, desc_key = PLATFORM_COPY_SCHEMAS[p].model_fields
+        fallback[title_key] = title
+        fallback[desc_key] = proposed_description or item_data.get("title", "")
+    return fallback
+
+
+async def run_copywriting(state: dict[str, Any]) -> dict[str, Any]:
+    """
+    LangGraph node: copywriting (runs alongside pricing).
+    Generates copy for the target platforms from the item data alone.
+    Returns only its own keys.
+    """
+    item_data: dict = state.get("item_data", {})
+    platforms: list[str] = state.get("platforms", ["ebay"])
+    if not item_data:
+        return {}
+
+    log.info("listing.copy_start", title=item_data.get("title"), platforms=platforms)
+    return {"listing_copy": await generate_copy(item_data, platforms, item_id=state.get("item_id"))}
 
+
+async def run_pricing(state: dict[str, Any]) -> dict[str, Any]:
+    """
+    LangGraph node: pricing (runs alongside copywriting).
+    Fetches comparables and estimates a price (LLM fallback without priced
+    comps). Returns only its own keys.
+    """
+    item_data: dict = state.get("item_data", {})
+    platforms: list[str] = state.get("platforms", ["ebay"])
+    if not item_data:
+        return {}
+
+    comparables = await _fetch_comparables(item_data, platforms, state.get("item_id"))
+    estimate = price_item(comparables, item_data.get("condition"))
+    # No priced comps (platform down, timed out, stubbed): still propose a price
+    fallback = await _fallback_price(item_data) if estimate is None else None
     log.info(
-        "listing.complete",
-        suggested_price=listing_copy.get("suggested_price"),
+        "listing.priced",
+        price=estimate.price if estimate else None,
+        fallback_price=fallback["suggested_price"] if fallback else None,
         comps_count=len(comparables),
     )
+    return {
+        "comparables": comparables,
+        "price_estimate": asdict(estimate) if estimate else None,
+        "fallback_price": fallback,
+    }
 
 
+async def run_listing(state: dict[str, Any]) -> dict[str, Any]:
+    """
+    LangGraph node: listing.
+    Joins the copywriting and pricing branches into the listing for approval.
+    """
+    item_data: dict = state.get("item_data", {})
+    if not item_data:
+        return {**state, "errors": state.get("errors", []) + ["No item data available for listing generation"]}
+
+    estimate = PriceEstimate(**state["price_estimate"]) if state.get("price_estimate") else None
+    fallback = state.get("fallback_price") if estimate is None else None
+    if fallback:
+        price = fallback["suggested_price"]
+        rationale = f"No priced comparable sales found; estimated from the item details: {fallback['price_rationale']}"
+    else:
+        price = estimate.price if estimate else None
+        rationale = _price_rationale(estimate)
+    listing_copy = {
+        **state.get("listing_copy", {}),
+        "suggested_price": price,
+        "price_rationale": rationale,
+    }
+
+    log.info(
+        "listing.complete",
+        suggested_price=listing_copy["suggested_price"],
+        comps_count=len(state.get("comparables", [])),
+    )
+
     return {
         **state,
         "step": "awaiting_approval",
-        "item_data": item_data,
-        "comparables": comparables,
         "listing_copy": listing_copy,
         "proposed_description": listing_copy.get("proposed_description", ""),
-        "suggested_price": listing_copy.get("suggested_price") or price_suggestion,
+        "suggested_price": listing_copy["suggested_price"],
         "awaiting_human": True,
     }
@@ -1,9 +1,11 @@
 """
 Publisher Agent — takes approved listing copy and posts to each target platform.
+Platforms added at approval time have no copy yet; it is generated here, on demand.
 """
 import structlog
 from typing import Any
 
+from .listing import generate_copy
 from ..platforms.base import ListingDraft
 from ..platforms.ebay import EbayAdapter
 from ..platforms.vinted import VintedAdapter
@@ -27,15 +29,25 @@ async def run_publisher(state: dict[str, Any]) -> dict[str, Any]:
     Posts approved listings to all target platforms.
     Expects state to contain human-approved listing_copy and final_price.
     """
-    listing_copy: dict = state.get("listing_copy", {})
+    listing_copy: dict = dict(state.get("listing_copy", {}))
     item_data: dict = state.get("item_data", {})
-    platforms: list[str] = state.get("platforms", ["ebay"])
+    human_input: dict = state.get("human_input", {})
+    platforms: list[str] = human_input.get("platforms") or state.get("platforms", ["ebay"])
     final_price: float = state.get("final_price") or state.get("suggested_price", 0)
     image_paths: list[str] = state.get("image_paths", [])
 
     published: list[dict] = []
     errors: list[str] = list(state.get("errors", []))
 
+    missing = [
+        p for p in platforms
+        if p in PLATFORM_COPY_KEYS and not all(listing_copy.get(k) for k in PLATFORM_COPY_KEYS[p])
+    ]
+    if missing:
+        log.info("publisher.generating_copy", platforms=missing)
+        approved = human_input.get("description") or state.get("proposed_description") or None
+        listing_copy.update(await generate_copy(item_data, missing, proposed_description=approved))
+
     for platform_name in platforms:
         adapter_cls = PLATFORM_ADAPTERS.get(platform_name)
         if not adapter_cls:
@@ -45,7 +57,7 @@ async def run_publisher(state: dict[str, Any]) -> dict[str, Any]:
         title_key, desc_key = PLATFORM_COPY_KEYS.get(platform_name, ("ebay_title", "ebay_description"))
         title = listing_copy.get(title_key) or item_data.get("title", "Item for sale")
         # Prefer the human-approved description; fall back to LLM-generated copy
-        human_description = state.get("human_input", {}).get("description", "")
+        human_description = human_input.get("description", "")
         raw_description = human_description or listing_copy.get(desc_key) or ""
         # Ensure description is wrapped in HTML for eBay
         if raw_description and not raw_description.strip().startswith("<"):
@@ -91,6 +103,8 @@ async def run_publisher(state: dict[str, Any]) -> dict[str, Any]:
     return {
         **state,
         "step": "managing",
+        "platforms": platforms,
+        "listing_copy": listing_copy,
         "published_listings": published,
         "errors": errors,
         "awaiting_human": False,
@@ -12,18 +12,31 @@ from typing import Optional
 import structlog
 from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, BackgroundTasks
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, desc
+from sqlalchemy import select, desc, insert, delete
+from pydantic import TypeAdapter, ValidationError
 from sqlalchemy.orm import selectinload
 
 from ..models.db import (
     get_db, DBItem, DBListing, DBOffer, DBMessage, DBComparable, DBUser,
     ItemStatusEnum, ListingStatusEnum, OfferStatusEnum,
 )
-from ..models.schemas import Item, Listing, Offer, Message, OfferDecision
+from ..models.schemas import (
+    Item, Listing, Offer, Message, OfferDecision, PresignRequest, PresignedUpload,
+    BulkItemSpec, BulkIntakeResponse,
+)
 from ..graph.workflow import build_graph
+from ..agents.listing import discard_comparables_prefetch
+from ..agents.publisher import PLATFORM_ADAPTERS as PUBLISHER_ADAPTERS
 from ..auth import get_current_user, AuthUser
-from ..storage import upload_image, get_image_url
+from ..storage import (
+    upload_images, create_derivatives, delete_image, get_image_url, presign_upload, verify_upload,
+    UploadBudget, UploadTooLargeError, InvalidUploadError,
+)
 from ..config import settings
+from ..image_cache import image_cache
+from ..images import image_phashes
+from ..image_index import ItemMatch, find_similar_item, record_item_hashes
+from ..pricing import parse_sold_at
 from .websocket import manager
 
 log = structlog.get_logger()
@@ -94,22 +107,53 @@ async def get_item(
     return item
 
 
+@router.post("/uploads/presign", response_model=list[PresignedUpload])
+async def presign_uploads(
+    body: PresignRequest,
+    current_user: AuthUser = Depends(get_current_user),
+):
+    """
+    Issue presigned POSTs so clients upload photos straight to S3.
+    Pass the returned keys as `image_keys` to POST /api/items.
+    """
+    try:
+        return await asyncio.gather(*(
+            presign_upload(current_user.user_id, f.filename, f.content_type) for f in body.files
+        ))
+    except InvalidUploadError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
 @router.post("/items", response_model=Item)
 async def create_item(
     background_tasks: BackgroundTasks,
     description: Optional[str] = Form(None),
     platforms: str = Form("ebay"),
     images: list[UploadFile] = File(default=[]),
+    image_keys: Optional[str] = Form(None),  # JSON list of keys from /uploads/presign
     current_user: AuthUser = Depends(get_current_user),
     db: AsyncSession = Depends(get_db),
 ):
     """Create a new item and kick off the agent pipeline."""
     await _ensure_user(current_user, db)
 
-    image_keys: list[str] = []
-    for image in images:
-        key = await upload_image(image, current_user.user_id)
-        image_keys.append(key)
+    direct_keys: list[str] = []
+    if image_keys:
+        try:
+            direct_keys = TypeAdapter(list[str]).validate_json(image_keys)
+        except ValidationError:
+            raise HTTPException(status_code=400, detail="image_keys must be a JSON list of strings")
+
+    try:
+        verified = await asyncio.gather(*(verify_upload(k, current_user.user_id) for k in direct_keys))
+        budget = UploadBudget()
+        budget.consume(sum(v.size for v in verified))
+        stored_images = await upload_images(images, current_user.user_id, budget)
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except InvalidUploadError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    image_keys = [v.key for v in verified] + [s.key for s in stored_images]
 
     db_item = DBItem(
         user_id=current_user.user_id,
@@ -139,6 +183,90 @@ async def create_item(
     return db_item
 
 
+@router.post("/items/bulk", response_model=BulkIntakeResponse)
+async def create_items_bulk(
+    background_tasks: BackgroundTasks,
+    manifest: str = Form(...),  # JSON list of BulkItemSpec
+    images: list[UploadFile] = File(default=[]),
+    current_user: AuthUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Create many items in one request and run their pipelines in a bounded pool.
+    Each manifest entry names its photos by `image_keys` (presigned uploads)
+    and/or `files` (indexes into `images`). Progress is broadcast on
+    WS /ws/batch:{batch_id}.
+    """
+    await _ensure_user(current_user, db)
+
+    try:
+        specs = TypeAdapter(list[BulkItemSpec]).validate_json(manifest)
+    except ValidationError:
+        raise HTTPException(status_code=400, detail="manifest must be a JSON list of items")
+    if not specs:
+        raise HTTPException(status_code=400, detail="manifest is empty")
+    if len(specs) > settings.BULK_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"At most {settings.BULK_MAX_ITEMS} items per request")
+
+    file_refs = [i for spec in specs for i in spec.files]
+    if sorted(file_refs) != list(range(len(images))):
+        raise HTTPException(status_code=400, detail="Every uploaded image must belong to exactly one item")
+
+    try:
+        verified = await asyncio.gather(*(
+            verify_upload(k, current_user.user_id) for spec in specs for k in spec.image_keys
+        ))
+        budget = UploadBudget(settings.max_bulk_request_bytes)
+        budget.consume(sum(v.size for v in verified))
+        stored_images = await upload_images(images, current_user.user_id, budget)
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except InvalidUploadError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    item_keys = [spec.image_keys + [stored_images[i].key for i in spec.files] for spec in specs]
+    item_ids = list(await db.scalars(
+        insert(DBItem).returning(DBItem.id, sort_by_parameter_order=True),
+        [
+            {
+                "user_id": current_user.user_id,
+                "user_description": spec.description,
+                "image_paths": json.dumps(keys),
+                "status": ItemStatusEnum.analyzing,
+            }
+            for spec, keys in zip(specs, item_keys)
+        ],
+    ))
+    await db.commit()
+
+    result = await db.execute(
+        select(DBItem)
+        .options(*_item_options())
+        .where(DBItem.id.in_(item_ids))
+        .order_by(DBItem.id)
+    )
+    items = result.scalars().all()
+
+    batch_id = uuid.uuid4().hex
+    background_tasks.add_task(
+        run_bulk_pipelines,
+        batch_id=batch_id,
+        jobs=[
+            {
+                "item_id": item_id,
+                "image_keys": keys,
+                "user_description": spec.description or "",
+                "platforms": spec.platforms,
+                "user_id": current_user.user_id,
+            }
+            for item_id, spec, keys in zip(item_ids, specs, item_keys)
+        ],
+    )
+    log.info("bulk.accepted", batch_id=batch_id, items=len(item_ids), images=len(images) + len(verified))
+
+    return {"batch_id": batch_id, "items": items}
+
+
 @router.delete("/items/{item_id}")
 async def delete_item(
     item_id: int,
@@ -151,8 +279,19 @@ async def delete_item(
     item = result.scalar_one_or_none()
     if not item:
         raise HTTPException(status_code=404, detail="Item not found")
+    try:
+        image_keys = json.loads(item.image_paths or "[]")
+    except json.JSONDecodeError:
+        image_keys = []
     await db.delete(item)
     await db.commit()
+
+    # Release the item's photos; content-addressed ones shared with other
+    # items only lose a reference and stay in place.
+    results = await asyncio.gather(*(delete_image(k) for k in image_keys), return_exceptions=True)
+    for key, r in zip(image_keys, results):
+        if isinstance(r, Exception):
+            log.warning("delete_item.image_error", item_id=item_id, key=key, error=str(r))
     return {"ok": True}
 
 
@@ -166,6 +305,7 @@ async def approve_listing(
     final_price: float,
     background_tasks: BackgroundTasks,
     description: Optional[str] = None,
+    platforms: Optional[str] = None,  # comma-separated; overrides the platforms chosen at creation
     current_user: AuthUser = Depends(get_current_user),
     db: AsyncSession = Depends(get_db),
 ):
@@ -176,6 +316,17 @@ async def approve_listing(
     if not item:
         raise HTTPException(status_code=404, detail="Item not found")
 
+    target_platforms = None
+    if platforms:
+        target_platforms = [p.strip().lower() for p in platforms.split(",") if p.strip()]
+        unknown = [p for p in target_platforms if p not in PUBLISHER_ADAPTERS]
+        if unknown or not target_platforms:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Unknown platforms: {', '.join(unknown) or platforms!r}; "
+                       f"supported: {', '.join(PUBLISHER_ADAPTERS)}",
+            )
+
     item.final_price = final_price
     item.status = ItemStatusEnum.publishing
     # Persist the user-edited description (overrides AI proposal if provided)
@@ -191,11 +342,42 @@ async def approve_listing(
             "action": "approve",
             "final_price": final_price,
             "description": description or item.proposed_description,
+            "platforms": target_platforms,
         },
     )
     return {"ok": True}
 
 
+@router.post("/items/{item_id}/reuse")
+async def accept_reuse(
+    item_id: int,
+    source_item_id: int,
+    background_tasks: BackgroundTasks,
+    current_user: AuthUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """Accept a `reuse_match` offer: replace the item's analysis and copy with the matched item's."""
+    result = await db.execute(
+        select(DBItem).where(
+            DBItem.id.in_((item_id, source_item_id)),
+            DBItem.user_id == current_user.user_id,
+        )
+    )
+    items = {i.id: i for i in result.scalars().all()}
+    if item_id not in items or source_item_id not in items or item_id == source_item_id:
+        raise HTTPException(status_code=404, detail="Item not found")
+    if items[item_id].status != ItemStatusEnum.ready:
+        raise HTTPException(status_code=409, detail="Item is not awaiting approval")
+
+    background_tasks.add_task(
+        reuse_prior_analysis,
+        item_id=item_id,
+        source_item_id=source_item_id,
+        user_id=current_user.user_id,
+    )
+    return {"ok": True}
+
+
 @router.post("/items/{item_id}/cancel")
 async def cancel_item(
     item_id: int,
@@ -389,11 +571,15 @@ async def run_agent_pipeline(
     user_description: str,
     platforms: list[str],
     user_id: str,
-):
-    """Run the full LangGraph pipeline for a new item."""
+) -> bool:
+    """Run the full LangGraph pipeline for a new item. Returns False if it errored."""
     thread_id = f"{user_id}:{item_id}"
-    # Resolve storage keys to local paths or URLs for the intake agent
-    image_paths = [_resolve_image_path(k) for k in image_keys]
+    log.info("pipeline.start", item_id=item_id, platforms=platforms)
+
+    # Resized variants (thumb/listing/vision) — off the event loop, in the image process pool
+    await asyncio.gather(*(create_derivatives(k) for k in image_keys))
+    # Resolve storage keys to local paths for the intake agent
+    image_paths = await _resolve_image_paths(image_keys)
     initial_state = {
         "item_id": item_id,
         "user_id": user_id,
@@ -403,8 +589,8 @@ async def run_agent_pipeline(
         "platforms": platforms,
         "errors": [],
     }
+    match = await _match_prior_item(item_id, user_id, image_paths)
 
-    log.info("pipeline.start", item_id=item_id, platforms=platforms)
     await manager.broadcast(str(item_id), {"type": "step", "step": "intake", "item_id": item_id})
 
     try:
@@ -415,6 +601,23 @@ async def run_agent_pipeline(
             )
             config = {"configurable": {"thread_id": thread_id}}
 
+            if match is not None:
+                applied = False
+                if settings.ITEM_REUSE == "auto":
+                    reused = await _reused_state(graph, user_id, match.item_id)
+                    if reused:
+                        initial_state.update(reused)
+                        applied = True
+                log.info("pipeline.reuse_match", item_id=item_id, source_item_id=match.item_id, applied=applied)
+                await manager.broadcast(str(item_id), {
+                    "type": "reuse_match",
+                    "item_id": item_id,
+                    "source_item_id": match.item_id,
+                    "matched_images": match.matched,
+                    "distance": match.distance,
+                    "applied": applied,
+                })
+
             async for event in graph.astream(initial_state, config=config, stream_mode="updates"):
                 if not isinstance(event, dict):
                     # LangGraph emits interrupt signals as tuples — skip them
@@ -438,6 +641,7 @@ async def run_agent_pipeline(
                     await _sync_state_to_db(item_id, node_name, state_snapshot)
 
         log.info("pipeline.complete", item_id=item_id)
+        return True
 
     except Exception as e:
         log.error("pipeline.error", item_id=item_id, error=str(e), exc_info=True)
@@ -454,6 +658,94 @@ async def run_agent_pipeline(
             "item_id": item_id,
             "error": str(e),
         })
+        return False
+    finally:
+        discard_comparables_prefetch(item_id)
+        await image_cache.release(image_paths)
+
+
+# Graph state copied from a matched earlier item (ITEM_REUSE=auto, or accepted via /reuse)
+_REUSED_KEYS = ("item_data", "comparables", "listing_copy", "proposed_description", "suggested_price")
+
+
+async def _reused_state(graph, user_id: str, source_item_id: int) -> dict:
+    """The reusable part of an earlier item's graph state, or {} if it has no analysis."""
+    prior = await graph.aget_state({"configurable": {"thread_id": f"{user_id}:{source_item_id}"}})
+    reused = {k: prior.values[k] for k in _REUSED_KEYS if prior and prior.values.get(k)}
+    if not reused.get("item_data"):
+        return {}
+    return {**reused, "reused_from": source_item_id}
+
+
+async def _match_prior_item(item_id: int, user_id: str, image_paths: list[str]) -> Optional[ItemMatch]:
+    """
+    Hash the item's photos, record the hashes and look for an earlier item of
+    the same user with matching photos. Best effort: errors only skip reuse.
+    """
+    if settings.ITEM_REUSE == "off" or not image_paths:
+        return None
+    try:
+        hashes = await image_phashes([p for p in image_paths if Path(p).exists()])
+        match = await find_similar_item(user_id, hashes, exclude_item_id=item_id)
+        await record_item_hashes(item_id, user_id, hashes)
+        return match
+    except Exception as e:
+        log.warning("pipeline.reuse_lookup_error", item_id=item_id, error=str(e))
+        return None
+
+
+# Shared by every bulk batch, so concurrent bulk requests don't multiply the load
+_pipeline_slots: Optional[asyncio.Semaphore] = None
+
+
+async def run_bulk_pipelines(batch_id: str, jobs: list[dict]):
+    """
+    Run the pipelines of a bulk batch, at most PIPELINE_CONCURRENCY at a time
+    across the process, broadcasting progress on the `batch:{batch_id}` channel.
+    """
+    global _pipeline_slots
+    if _pipeline_slots is None:
+        _pipeline_slots = asyncio.Semaphore(max(1, settings.PIPELINE_CONCURRENCY))
+
+    channel = f"batch:{batch_id}"
+    total = len(jobs)
+    completed = failed = 0
+    log.info("bulk.start", batch_id=batch_id, items=total)
+    await manager.broadcast(channel, {
+        "type": "batch_started",
+        "batch_id": batch_id,
+        "total": total,
+        "item_ids": [j["item_id"] for j in jobs],
+    })
+
+    async def _one(job: dict):
+        nonlocal completed, failed
+        async with _pipeline_slots:
+            try:
+                ok = await run_agent_pipeline(**job)
+            except Exception as e:
+                log.error("bulk.item_error", batch_id=batch_id, item_id=job["item_id"], error=str(e))
+                ok = False
+        completed += 1
+        failed += not ok
+        await manager.broadcast(channel, {
+            "type": "batch_progress",
+            "batch_id": batch_id,
+            "item_id": job["item_id"],
+            "ok": ok,
+            "completed": completed,
+            "failed": failed,
+            "total": total,
+        })
+
+    await asyncio.gather(*(_one(j) for j in jobs))
+    log.info("bulk.complete", batch_id=batch_id, items=total, failed=failed)
+    await manager.broadcast(channel, {
+        "type": "batch_complete",
+        "batch_id": batch_id,
+        "total": total,
+        "failed": failed,
+    })
 
 
 async def resume_agent(item_id: int, user_id: str, human_input: dict):
@@ -496,6 +788,56 @@ async def resume_agent(item_id: int, user_id: str, human_input: dict):
         await manager.broadcast(str(item_id), {"type": "error", "item_id": item_id, "error": str(e)})
 
 
+async def reuse_prior_analysis(item_id: int, source_item_id: int, user_id: str):
+    """
+    Re-enter an item's graph at `reused` with an earlier item's analysis and
+    copy (an accepted ITEM_REUSE=offer match). The item is paused at approval,
+    so the new run replaces its proposal and pauses there again.
+    """
+    thread_id = f"{user_id}:{item_id}"
+    log.info("pipeline.reuse_accepted", item_id=item_id, source_item_id=source_item_id)
+
+    try:
+        async with _get_checkpointer() as saver:
+            graph = build_graph().compile(
+                checkpointer=saver,
+                interrupt_before=["awaiting_approval", "awaiting_offer_decision"],
+            )
+            config = {"configurable": {"thread_id": thread_id}}
+
+            reused = await _reused_state(graph, user_id, source_item_id)
+            if not reused:
+                raise ValueError(f"Item {source_item_id} has no analysis to reuse")
+
+            # The reused comparables replace the ones saved by the item's own listing run
+            from ..models.db import AsyncSessionLocal
+            async with AsyncSessionLocal() as db:
+                await db.execute(delete(DBComparable).where(DBComparable.item_id == item_id))
+                await db.commit()
+
+            # A new input on the paused thread starts over at the entry point,
+            # which routes to `reused` now that reused_from and listing_copy are set.
+            async for event in graph.astream(reused, config=config, stream_mode="updates"):
+                if not isinstance(event, dict):
+                    log.info("graph.interrupt", item_id=item_id)
+                    continue
+                for node_name, state_snapshot in event.items():
+                    if node_name == "__interrupt__" or not isinstance(state_snapshot, dict):
+                        continue
+                    log.info("graph.event", node=node_name, item_id=item_id)
+                    await manager.broadcast(str(item_id), {
+                        "type": "step",
+                        "step": node_name,
+                        "item_id": item_id,
+                        "data": _safe_state(state_snapshot),
+                    })
+                    await _sync_state_to_db(item_id, node_name, state_snapshot)
+
+    except Exception as e:
+        log.error("reuse.error", item_id=item_id, error=str(e), exc_info=True)
+        await manager.broadcast(str(item_id), {"type": "error", "item_id": item_id, "error": str(e)})
+
+
 async def _sync_state_to_db(item_id: int, node_name: str, state: dict):
     """Persist relevant agent state back to the SQLite application DB."""
     from ..models.db import AsyncSessionLocal
@@ -505,7 +847,7 @@ async def _sync_state_to_db(item_id: int, node_name: str, state: dict):
         if not item:
             return
 
-        if node_name == "listing" and state.get("item_data"):
+        if node_name in ("listing", "reused") and state.get("item_data"):
             d = state["item_data"]
             item.title = d.get("title")
             item.category = d.get("category")
@@ -528,6 +870,7 @@ async def _sync_state_to_db(item_id: int, node_name: str, state: dict):
                     sold_price=comp.get("sold_price", 0),
                     url=comp.get("url"),
                     condition=comp.get("condition"),
+                    sold_at=parse_sold_at(comp.get("sold_at")),
                 ))
 
         elif node_name == "publisher":
@@ -597,11 +940,15 @@ def _safe_state(state: object) -> dict:
     return safe
 
 
-def _resolve_image_path(key: str) -> str:
+async def _resolve_image_paths(keys: list[str]) -> list[str]:
     """
-    For local dev: key is already a filesystem path, return as-is.
-    For S3: key is an S3 object key — the intake agent needs a local temp file
-    or a signed URL. For now we return the key and let the intake agent handle it.
-    In a full S3 implementation you'd download to a temp file here.
+    For local dev: keys are already filesystem paths, return as-is.
+    For S3: prefetch every image of the item into the local read-through cache
+    (vision derivative when available) and return the cached file paths, pinned
+    until the pipeline calls image_cache.release().
+    Keys that cannot be fetched are passed through; intake logs and skips them.
     """
-    return key
+    if not settings.use_s3:
+        return keys
+    paths = await image_cache.prefetch(keys)
+    return [str(p) if p else k for p, k in zip(paths, keys)]
@@ -0,0 +1,73 @@
+"""
+Static serving for ./uploads (local storage mode).
+
+Extends Starlette's StaticFiles with an explicit cache policy:
+- Content-addressed files (named by their SHA-256) never change, so they get a
+  strong ETag derived from the hash and `Cache-Control: immutable`.
+- Other uploads get a stat-based ETag and UPLOADS_CACHE_MAX_AGE.
+- If-None-Match → 304 and Range requests are handled by Starlette.
+- With UPLOADS_PRECOMPRESSED=true, a `<file>.br` / `<file>.gz` sibling is served
+  when the client accepts that encoding.
+"""
+import os
+import re
+import mimetypes
+
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+from starlette.types import Scope
+
+from ..config import settings
+from ..storage import IMMUTABLE_CACHE_CONTROL
+
+# <sha256>.<ext> or <sha256>_<variant>.webp
+_CONTENT_ADDRESSED = re.compile(r"^[0-9a-f]{64}(?:_[a-z]+)?$")
+
+_PRECOMPRESSED = (("br", ".br"), ("gzip", ".gz"))
+
+
+class UploadsStaticFiles(StaticFiles):
+    def file_response(
+        self,
+        full_path: "os.PathLike[str] | str",
+        stat_result: os.stat_result,
+        scope: Scope,
+        status_code: int = 200,
+    ) -> Response:
+        request_headers = Headers(scope=scope)
+        full_path = str(full_path)
+        name = os.path.basename(full_path)
+        stem, _ = os.path.splitext(name)
+
+        if _CONTENT_ADDRESSED.match(stem):
+            etag = f'"{stem}"'
+            cache_control = IMMUTABLE_CACHE_CONTROL
+        else:
+            etag = f'"{stat_result.st_mtime_ns:x}-{stat_result.st_size:x}"'
+            cache_control = f"public, max-age={settings.UPLOADS_CACHE_MAX_AGE}"
+
+        headers = {"cache-control": cache_control}
+        path = full_path
+        if settings.UPLOADS_PRECOMPRESSED:
+            headers["vary"] = "Accept-Encoding"
+            accepted = request_headers.get("accept-encoding", "")
+            for encoding, ext in _PRECOMPRESSED:
+                if encoding in accepted and os.path.isfile(full_path + ext):
+                    path = full_path + ext
+                    stat_result = os.stat(path)
+                    headers["content-encoding"] = encoding
+                    etag = f'{etag[:-1]}-{encoding}"'
+                    break
+        headers["etag"] = etag
+
+        response = FileResponse(
+            path,
+            status_code=status_code,
+            headers=headers,
+            media_type=mimetypes.guess_type(name)[0] or "application/octet-stream",
+            stat_result=stat_result,
+        )
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        return response
@@ -0,0 +1,142 @@
+"""
+Key/value cache with TTL — Redis (production) or in-process (local dev).
+
+If REDIS_URL is set: entries live in Redis under `ernesto:cache:<namespace>:`
+with a native expiry, shared by every worker and surviving restarts. Size is
+bounded by the Redis eviction policy (render.yaml uses allkeys-lru).
+
+If REDIS_URL is empty: entries live in an in-process LRU dict bounded by
+`max_entries`.
+
+Values must be JSON-serialisable.
+
+StaleWhileRevalidate wraps either backend: entries are fresh for `ttl`, then
+served stale for up to `stale_ttl` more while a single background task per key
+reloads them. Concurrent misses for the same key share one load.
+"""
+import json
+import time
+import asyncio
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Optional
+
+import structlog
+
+from .config import settings
+
+log = structlog.get_logger()
+
+
+class MemoryCache:
+    def __init__(self, namespace: str, max_entries: int):
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self._data: "OrderedDict[str, tuple[float, Any]]" = OrderedDict()  # key → (expires_at, value)
+
+    async def get(self, key: str) -> Optional[Any]:
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.time():
+            self._data.pop(key, None)
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value: Any, ttl: float):
+        self._data[key] = (time.time() + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+
+    async def delete(self, key: str):
+        self._data.pop(key, None)
+
+
+class RedisCache:
+    def __init__(self, namespace: str):
+        self.namespace = namespace
+        self._redis = None
+
+    def _client(self):
+        if self._redis is None:
+            import redis.asyncio as aioredis  # type: ignore
+            self._redis = aioredis.from_url(settings.REDIS_URL)
+        return self._redis
+
+    def _key(self, key: str) -> str:
+        return f"ernesto:cache:{self.namespace}:{key}"
+
+    async def get(self, key: str) -> Optional[Any]:
+        try:
+            raw = await self._client().get(self._key(key))
+        except Exception as e:
+            log.warning("cache.redis_get_error", namespace=self.namespace, error=str(e))
+            return None
+        return json.loads(raw) if raw is not None else None
+
+    async def set(self, key: str, value: Any, ttl: float):
+        try:
+            await self._client().set(self._key(key), json.dumps(value), ex=max(1, int(ttl)))
+        except Exception as e:
+            log.warning("cache.redis_set_error", namespace=self.namespace, error=str(e))
+
+    async def delete(self, key: str):
+        try:
+            await self._client().delete(self._key(key))
+        except Exception as e:
+            log.warning("cache.redis_delete_error", namespace=self.namespace, error=str(e))
+
+
+def make_cache(namespace: str, max_entries: int):
+    """Return a Redis-backed cache when REDIS_URL is set, else an in-process one."""
+    if settings.use_redis:
+        return RedisCache(namespace)
+    return MemoryCache(namespace, max_entries)
+
+
+class StaleWhileRevalidate:
+    def __init__(self, cache, ttl: float, stale_ttl: float):
+        self.cache = cache
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.stats = {"hits": 0, "stale_hits": 0, "misses": 0, "refreshes": 0}
+        self._inflight: dict[str, asyncio.Task] = {}
+
+    async def _load(self, key: str, loader: Callable[[], Awaitable[Any]]) -> Any:
+        """Run `loader` and store its result; a None result is returned but not cached."""
+        value = await loader()
+        if value is not None:
+            entry = {"value": value, "fresh_until": time.time() + self.ttl}
+            await self.cache.set(key, entry, ttl=self.ttl + self.stale_ttl)
+        return value
+
+    def _start(self, key: str, loader: Callable[[], Awaitable[Any]]) -> asyncio.Task:
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._load(key, loader))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return task
+
+    async def get_or_load(self, key: str, loader: Callable[[], Awaitable[Any]]) -> Any:
+        entry = await self.cache.get(key)
+        if entry is not None:
+            if entry["fresh_until"] > time.time():
+                self.stats["hits"] += 1
+            else:
+                self.stats["stale_hits"] += 1
+                if key not in self._inflight:
+                    self.stats["refreshes"] += 1
+                    task = self._start(key, loader)
+                    task.add_done_callback(self._log_refresh_error)
+            return entry["value"]
+
+        self.stats["misses"] += 1
+        # shield: a cancelled caller must not cancel the load other callers share
+        return await asyncio.shield(self._start(key, loader))
+
+    def _log_refresh_error(self, task: asyncio.Task):
+        if not task.cancelled() and task.exception() is not None:
+            log.warning("cache.refresh_error", namespace=self.cache.namespace, error=str(task.exception()))
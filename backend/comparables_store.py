@@ -0,0 +1,158 @@
+"""
+Comparables warehouse.
+
+Every sold comparable fetched from a platform is upserted into
+comparable_listings, de-duplicated by (platform, marketplace, listing URL),
+so lookups for popular items are answered locally instead of by the platform.
+
+Titles are full-text indexed:
+  SQLite   — FTS5 external-content table kept in sync by triggers
+  Postgres — generated tsvector column with a GIN index
+Both are created idempotently at startup by init_comparables_store().
+"""
+import hashlib
+from datetime import datetime, timedelta, timezone
+
+import structlog
+from sqlalchemy import select, text, column, func, literal_column, Integer
+
+from .config import settings
+from .models.db import AsyncSessionLocal, DBComparableListing
+from .pricing import parse_sold_at
+
+log = structlog.get_logger()
+
+_SQLITE_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS comparable_listings_fts USING fts5(
+        title, content='comparable_listings', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS comparable_listings_ai AFTER INSERT ON comparable_listings BEGIN
+        INSERT INTO comparable_listings_fts(rowid, title) VALUES (new.id, new.title);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS comparable_listings_ad AFTER DELETE ON comparable_listings BEGIN
+        INSERT INTO comparable_listings_fts(comparable_listings_fts, rowid, title) VALUES ('delete', old.id, old.title);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS comparable_listings_au AFTER UPDATE OF title ON comparable_listings BEGIN
+        INSERT INTO comparable_listings_fts(comparable_listings_fts, rowid, title) VALUES ('delete', old.id, old.title);
+        INSERT INTO comparable_listings_fts(rowid, title) VALUES (new.id, new.title);
+    END""",
+]
+
+_POSTGRES_DDL = [
+    """ALTER TABLE comparable_listings ADD COLUMN IF NOT EXISTS search tsvector
+        GENERATED ALWAYS AS (to_tsvector('simple', coalesce(title, ''))) STORED""",
+    "CREATE INDEX IF NOT EXISTS ix_comparable_listings_search ON comparable_listings USING GIN (search)",
+]
+
+
+async def init_comparables_store(conn):
+    """Create the full-text index (call after metadata.create_all, same connection)."""
+    for ddl in _POSTGRES_DDL if settings.use_postgres else _SQLITE_DDL:
+        await conn.execute(text(ddl))
+
+
+def _insert():
+    if settings.use_postgres:
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert
+
+
+def _external_key(comp: dict) -> str:
+    if comp.get("url"):
+        return comp["url"][:500]
+    raw = f"{comp.get('title')}|{comp.get('sold_price')}|{comp.get('condition')}"
+    return "sha1:" + hashlib.sha1(raw.encode()).hexdigest()
+
+
+async def store_comparables(comps: list[dict], platform: str, marketplace: str):
+    """Upsert fetched comparables; an existing listing gets its price and fetched_at refreshed."""
+    now = datetime.now(timezone.utc)
+    rows: dict[str, dict] = {}
+    for c in comps:
+        if not c.get("title") or not c.get("sold_price"):
+            continue
+        key = _external_key(c)
+        rows[key] = {
+            "platform": platform,
+            "marketplace": marketplace,
+            "external_key": key,
+            "title": c["title"][:300],
+            "sold_price": c["sold_price"],
+            "url": c.get("url"),
+            "condition": c.get("condition"),
+            "sold_at": parse_sold_at(c.get("sold_at")),
+            "fetched_at": now,
+        }
+    if not rows:
+        return
+
+    stmt = _insert()(DBComparableListing).values(list(rows.values()))
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["platform", "marketplace", "external_key"],
+        set_={
+            "title": stmt.excluded.title,
+            "sold_price": stmt.excluded.sold_price,
+            "url": stmt.excluded.url,
+            "condition": stmt.excluded.condition,
+            "sold_at": stmt.excluded.sold_at,
+            "fetched_at": stmt.excluded.fetched_at,
+        },
+    )
+    async with AsyncSessionLocal() as db:
+        await db.execute(stmt)
+        await db.commit()
+
+
+async def search_comparables(
+    query_tokens: list[str],
+    platform: str,
+    marketplace: str,
+    limit: int,
+) -> list[dict]:
+    """
+    Fresh (COMPARABLES_WAREHOUSE_MAX_AGE_DAYS) comparables whose title contains
+    every query token, most recently fetched first.
+    """
+    if not query_tokens:
+        return []
+    cutoff = datetime.now(timezone.utc) - timedelta(days=settings.COMPARABLES_WAREHOUSE_MAX_AGE_DAYS)
+
+    if settings.use_postgres:
+        match = literal_column("comparable_listings.search").op("@@")(
+            func.plainto_tsquery("simple", " ".join(query_tokens))
+        )
+    else:
+        fts_query = " ".join(f'"{t}"' for t in query_tokens)  # implicit AND
+        match = DBComparableListing.id.in_(
+            text("SELECT rowid FROM comparable_listings_fts WHERE comparable_listings_fts MATCH :fts")
+            .bindparams(fts=fts_query)
+            .columns(column("rowid", Integer))
+        )
+
+    async with AsyncSessionLocal() as db:
+        rows = (await db.scalars(
+            select(DBComparableListing)
+            .where(
+                match,
+                DBComparableListing.platform == platform,
+                DBComparableListing.marketplace == marketplace,
+                DBComparableListing.fetched_at >= cutoff,
+            )
+            .order_by(DBComparableListing.fetched_at.desc())
+            .limit(limit)
+        )).all()
+
+    return [
+        {
+            "title": r.title,
+            "sold_price": r.sold_price,
+            "url": r.url,
+            "condition": r.condition,
+            "sold_at": r.sold_at.isoformat() if r.sold_at else None,
+            "platform": r.platform,
+        }
+        for r in rows
+    ]
@@ -14,6 +14,11 @@ class Settings(BaseSettings):
     SECRET_KEY: str = "dev-secret-key"
     CORS_ORIGINS: str = "http://localhost:5173,http://localhost:8081"
 
+    # --- LLM HTTP client (shared by all agents) ---
+    LLM_MAX_CONNECTIONS: int = 20
+    LLM_TIMEOUT_S: float = 60.0
+    LLM_STRUCTURED_OUTPUT: bool = True  # bind prompts to JSON schemas (strict mode)
+
     # --- Local dev mode (bypasses auth, S3, Redis) ---
     # Set to false in production
     LOCAL_DEV: bool = True
@@ -29,6 +34,91 @@ class Settings(BaseSettings):
     AWS_REGION: str = "us-east-1"
     AWS_ACCESS_KEY_ID: str = ""
     AWS_SECRET_ACCESS_KEY: str = ""
+    S3_MAX_POOL_CONNECTIONS: int = 50  # shared client connection pool size
+    S3_PRESIGN_EXPIRES: int = 900      # seconds a direct-upload URL stays valid
+
+    # --- Uploads ---
+    MAX_UPLOAD_FILE_MB: int = 25      # per image
+    MAX_UPLOAD_REQUEST_MB: int = 150  # all images of one request combined
+    UPLOAD_CHUNK_KB: int = 1024       # streaming read/write chunk size
+    UPLOAD_CONCURRENCY: int = 4       # images uploaded in parallel per request
+    # Name files by SHA-256 of their bytes: identical photos are stored once,
+    # URLs become immutable, and deletes are reference-counted.
+    CONTENT_ADDRESSED_STORAGE: bool = False
+
+    # --- Reuse of earlier analyses for relisted items (perceptual photo hashes) ---
+    ITEM_REUSE: str = "offer"         # off | offer (notify; POST /items/{id}/reuse accepts) | auto (skip intake + listing)
+    ITEM_REUSE_DISTANCE: int = 3      # max Hamming distance between photo hashes (0-3)
+
+    # --- Bulk intake (POST /api/items/bulk) ---
+    BULK_MAX_ITEMS: int = 200          # items per bulk request
+    BULK_MAX_REQUEST_MB: int = 2048    # all images of one bulk request combined
+    PIPELINE_CONCURRENCY: int = 4      # bulk pipelines running at once, process-wide
+
+    # --- Image derivatives (thumb / listing / vision WebP variants) ---
+    IMAGE_DERIVATIVES: bool = True
+    IMAGE_WORKERS: int = 2           # process pool size (resizing, vision prep, photo hashes)
+    IMAGE_WEBP_QUALITY: int = 82
+
+    # --- Vision input (intake agent) ---
+    VISION_MAX_DIM: int = 1024          # longest side sent to the model
+    VISION_MAX_IMAGES: int = 6          # best-scoring photos kept
+    VISION_HIGH_DETAIL_IMAGES: int = 2  # top photos sent at detail=high, rest at low
+    VISION_DUPLICATE_DISTANCE: int = 6  # dHash Hamming distance treated as a duplicate
+
+    # --- Intake hedging (vision vs text-only, when a description is given) ---
+    INTAKE_HEDGE: bool = True
+    # Start text-only this long after vision (0 = together). Keep it near the
+    # vision call's p90 latency, so the hedge only fires for the slow tail and
+    # the success path stays at one LLM call.
+    INTAKE_HEDGE_DELAY_S: float = 12.0
+    INTAKE_VISION_DEADLINE_S: float = 20.0  # after this, accept the text-only result
+
+    # --- Intake result cache (Redis when REDIS_URL is set, else in-process) ---
+    INTAKE_CACHE_ENABLED: bool = True
+    INTAKE_CACHE_TTL_HOURS: float = 168
+    INTAKE_CACHE_MAX_ENTRIES: int = 2000  # in-process backend only
+
+    # --- Comparables (listing agent) ---
+    COMPARABLES_LIMIT: int = 8          # sold comparables requested per platform
+    COMPARABLES_TIMEOUT_S: float = 8.0  # per-platform deadline; late platforms are skipped
+    # Per-platform overrides, e.g. COMPARABLES_PLATFORM_TIMEOUTS='{"vinted": 15}'
+    COMPARABLES_PLATFORM_TIMEOUTS: dict[str, float] = {}
+    # Shared by all items and users; keyed by normalised query, platform and marketplace
+    COMPARABLES_CACHE_ENABLED: bool = True
+    COMPARABLES_CACHE_TTL_HOURS: float = 12       # fresh
+    COMPARABLES_CACHE_STALE_HOURS: float = 72     # then served stale while refreshed
+    COMPARABLES_CACHE_MAX_ENTRIES: int = 5000     # in-process backend only
+    # Local warehouse of every fetched comparable (full-text indexed); answered
+    # from first, the platform is only queried when it has too few fresh hits
+    COMPARABLES_WAREHOUSE: bool = True
+    COMPARABLES_WAREHOUSE_MIN_HITS: int = 6
+    COMPARABLES_WAREHOUSE_MAX_AGE_DAYS: int = 30
+    # Start the comparables search from the user's description while intake runs
+    COMPARABLES_PREFETCH: bool = True
+    COMPARABLES_PREFETCH_MIN_OVERLAP: float = 0.5  # query token Jaccard to reuse as-is
+
+    # --- Listing copy streaming (proposed_description chunks over the item websocket) ---
+    LISTING_STREAM: bool = True
+    LISTING_STREAM_FPS: float = 10       # max websocket frames per second per item
+
+    # --- Pricing (robust estimate from comparables) ---
+    PRICING_OUTLIER_METHOD: str = "mad"           # mad | iqr
+    PRICING_RECENCY_HALF_LIFE_DAYS: float = 90    # weight of a comp halves every N days since sale (comps with a sale date only)
+
+    # --- Local cache of S3 images (read by the intake agent) ---
+    IMAGE_CACHE_DIR: str = "./.image_cache"
+    IMAGE_CACHE_MB: int = 512
+    IMAGE_CACHE_PREFETCH_CONCURRENCY: int = 4
+
+    # --- /uploads static serving (local mode) ---
+    UPLOADS_CACHE_MAX_AGE: int = 86400  # non-content-addressed files
+    UPLOADS_PRECOMPRESSED: bool = False  # serve <file>.br / <file>.gz when accepted
+
+    # --- Storage garbage collection (orphaned images) ---
+    GC_INTERVAL_HOURS: float = 0   # 0 = disabled; run `python -m backend.storage_gc` by hand
+    GC_MIN_AGE_HOURS: float = 24   # never touch objects younger than this
+    GC_DRY_RUN: bool = True        # periodic runs only report until set to false
 
     # --- Real-time (Redis — production) ---
     REDIS_URL: str = ""
@@ -71,6 +161,22 @@ class Settings(BaseSettings):
     def use_s3(self) -> bool:
         return bool(self.S3_BUCKET)
 
+    @property
+    def max_upload_file_bytes(self) -> int:
+        return self.MAX_UPLOAD_FILE_MB * 1024 * 1024
+
+    @property
+    def max_upload_request_bytes(self) -> int:
+        return self.MAX_UPLOAD_REQUEST_MB * 1024 * 1024
+
+    @property
+    def max_bulk_request_bytes(self) -> int:
+        return self.BULK_MAX_REQUEST_MB * 1024 * 1024
+
+    @property
+    def upload_chunk_bytes(self) -> int:
+        return self.UPLOAD_CHUNK_KB * 1024
+
     @property
     def use_redis(self) -> bool:
         return bool(self.REDIS_URL)
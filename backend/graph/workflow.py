@@ -2,25 +2,51 @@
 LangGraph workflow for Ernesto.
 
 Graph topology:
-  intake → listing → [HUMAN APPROVAL] → publisher → deal_manager → [HUMAN OFFER DECISION] → deal_manager (loop)
+  intake ─┬→ copywriting ─┬→ listing → [HUMAN APPROVAL] → publisher → deal_manager → [HUMAN OFFER DECISION] → deal_manager (loop)
+          └→ pricing ─────┘
+
+copywriting and pricing run concurrently and return only their own keys;
+the state reducer merges each update into the current state, so both land
+before listing joins them.
+
+A relisted item whose photos match an earlier item (ITEM_REUSE=auto, or a match
+accepted via POST /api/items/{id}/reuse) enters at `reused` with that item's
+analysis and copy, skipping intake and listing.
 
 Human-in-the-loop is implemented via interrupt_before on the approval and offer nodes.
 State is persisted in SQLite via LangGraph's SqliteSaver.
 """
-from typing import Any, Literal
+from typing import Annotated, Any, Literal
 from langgraph.graph import StateGraph, END
 from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
 
 from ..agents.intake import run_intake
-from ..agents.listing import run_listing
+from ..agents.listing import run_listing, run_copywriting, run_pricing
 from ..agents.publisher import run_publisher
 from ..agents.deal_manager import run_deal_manager
 
 
+def merge_state(current: dict, update: dict) -> dict:
+    """State reducer: apply a node's (full or partial) update on top of the current state."""
+    return {**current, **update}
+
+
 # ---------------------------------------------------------------------------
 # Routing helpers
 # ---------------------------------------------------------------------------
 
+LISTING_BRANCHES = ["copywriting", "pricing"]
+
+
+def route_entry(state: dict[str, Any]) -> str | list[str]:
+    if state.get("reused_from"):
+        if state.get("listing_copy"):
+            return "reused"
+        if state.get("item_data"):
+            return LISTING_BRANCHES
+    return "intake"
+
+
 def route_after_listing(state: dict[str, Any]) -> Literal["awaiting_approval", "error"]:
     if state.get("errors") and not state.get("listing_copy"):
         return "error"
@@ -53,6 +79,11 @@ def route_after_offer_decision(state: dict[str, Any]) -> Literal["deal_manager",
 # Passthrough nodes (for interrupt points)
 # ---------------------------------------------------------------------------
 
+async def reused_node(state: dict[str, Any]) -> dict[str, Any]:
+    """Entry for items reusing an earlier analysis: straight to approval."""
+    return {**state, "step": "awaiting_approval", "awaiting_human": True}
+
+
 async def awaiting_approval_node(state: dict[str, Any]) -> dict[str, Any]:
     """Interrupt point: human reviews listing copy and price before publishing."""
     return state
@@ -85,10 +116,13 @@ async def managing_node(state: dict[str, Any]) -> dict[str, Any]:
 # ---------------------------------------------------------------------------
 
 def build_graph() -> StateGraph:
-    g = StateGraph(dict)
+    g = StateGraph(Annotated[dict, merge_state])
 
     g.add_node("intake", run_intake)
+    g.add_node("copywriting", run_copywriting)
+    g.add_node("pricing", run_pricing)
     g.add_node("listing", run_listing)
+    g.add_node("reused", reused_node)
     g.add_node("awaiting_approval", awaiting_approval_node)
     g.add_node("publisher", run_publisher)
     g.add_node("deal_manager", run_deal_manager)
@@ -98,9 +132,17 @@ def build_graph() -> StateGraph:
     g.add_node("sold", sold_node)
     g.add_node("error", error_node)
 
-    g.set_entry_point("intake")
+    g.set_conditional_entry_point(route_entry, {
+        "intake": "intake",
+        "copywriting": "copywriting",
+        "pricing": "pricing",
+        "reused": "reused",
+    })
 
-    g.add_edge("intake", "listing")
+    for branch in LISTING_BRANCHES:
+        g.add_edge("intake", branch)
+    g.add_edge(LISTING_BRANCHES, "listing")
+    g.add_edge("reused", "awaiting_approval")
     g.add_conditional_edges("listing", route_after_listing, {
         "awaiting_approval": "awaiting_approval",
         "error": "error",
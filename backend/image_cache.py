@@ -0,0 +1,155 @@
+"""
+Read-through disk cache for S3 images.
+
+The intake agent needs local files, but in S3 mode image keys point at the
+bucket. This cache downloads objects on first use into IMAGE_CACHE_DIR
+(mirroring the key layout, so derivatives sit next to their original),
+streams them to disk, and evicts least-recently-used files once the total
+size exceeds IMAGE_CACHE_MB. Concurrent requests for the same key share a
+single download. Files handed to a running pipeline are pinned (prefetch ..
+release) and never evicted while in use; the cache may briefly exceed its
+budget instead.
+
+In local mode keys are already filesystem paths and are returned unchanged.
+"""
+import asyncio
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional
+
+import structlog
+
+from .config import settings
+from .storage import download_image, derivative_key
+
+log = structlog.get_logger()
+
+
+class ImageCache:
+    def __init__(self, root: Path, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, int]" = OrderedDict()  # path → size, LRU first
+        self._total = 0
+        self._inflight: dict[str, asyncio.Task] = {}
+        self._pins: dict[str, int] = {}  # path → pipelines using it
+        self._loaded = False
+
+    def _path_for(self, key: str) -> Path:
+        path = (self.root / key.lstrip("/")).resolve()
+        if self.root.resolve() not in path.parents:
+            raise ValueError(f"Invalid storage key: {key}")
+        return path
+
+    def _load_index(self):
+        """Rebuild the LRU index from files already on disk (oldest access first)."""
+        self.root.mkdir(parents=True, exist_ok=True)
+        files = [p for p in self.root.rglob("*") if p.is_file() and not p.name.endswith(".part")]
+        files.sort(key=lambda p: p.stat().st_atime)
+        for p in files:
+            size = p.stat().st_size
+            self._entries[str(p)] = size
+            self._total += size
+        self._loaded = True
+        log.info("image_cache.loaded", files=len(files), bytes=self._total)
+
+    async def get(self, key: str, pin: bool = False) -> Path:
+        """
+        Return a local path for `key`, downloading it if not cached.
+        With pin=True the file is kept until release() is called for it.
+        """
+        if not settings.use_s3:
+            return Path(key)
+        if not self._loaded:
+            await asyncio.to_thread(self._load_index)
+
+        path = self._path_for(key)
+        entry = str(path)
+        if pin:
+            # Pinned before any await, so no eviction can slip in between
+            self._pins[entry] = self._pins.get(entry, 0) + 1
+        try:
+            if entry in self._entries and path.exists():
+                self._entries.move_to_end(entry)
+                return path
+
+            task = self._inflight.get(entry)
+            if task is None:
+                task = asyncio.create_task(self._fetch(key, path))
+                self._inflight[entry] = task
+                task.add_done_callback(lambda _: self._inflight.pop(entry, None))
+            return await asyncio.shield(task)
+        except BaseException:
+            if pin:
+                self._unpin(entry)
+            raise
+
+    def _unpin(self, entry: str):
+        count = self._pins.get(entry, 0) - 1
+        if count > 0:
+            self._pins[entry] = count
+        else:
+            self._pins.pop(entry, None)
+
+    async def release(self, paths: list[str]):
+        """Unpin files returned by prefetch() and evict if the cache is over budget."""
+        if not settings.use_s3:
+            return
+        for p in paths:
+            self._unpin(str(Path(p).resolve()))
+        await self._evict()
+
+    async def _fetch(self, key: str, path: Path) -> Path:
+        await asyncio.to_thread(path.parent.mkdir, parents=True, exist_ok=True)
+        await download_image(key, path)
+        size = (await asyncio.to_thread(path.stat)).st_size
+        entry = str(path)
+        self._total += size - self._entries.pop(entry, 0)
+        self._entries[entry] = size
+        log.info("image_cache.miss", key=key, size=size)
+        await self._evict()
+        return path
+
+    async def _evict(self):
+        victims: list[str] = []
+        # Least recently used first, skipping files a pipeline is still using
+        for entry in list(self._entries):
+            if self._total <= self.max_bytes or len(self._entries) <= 1:
+                break
+            if entry in self._pins:
+                continue
+            self._total -= self._entries.pop(entry)
+            victims.append(entry)
+        for entry in victims:
+            await asyncio.to_thread(Path(entry).unlink, missing_ok=True)
+        if victims:
+            log.info("image_cache.evicted", files=len(victims), bytes=self._total)
+
+    async def get_for_vision(self, key: str, pin: bool = False) -> Optional[Path]:
+        """Prefer the downsized vision derivative; fall back to the original."""
+        for candidate in (derivative_key(key, "vision"), key):
+            try:
+                return await self.get(candidate, pin=pin)
+            except Exception as e:
+                log.debug("image_cache.fetch_failed", key=candidate, error=str(e))
+        log.warning("image_cache.unavailable", key=key)
+        return None
+
+    async def prefetch(self, keys: list[str]) -> list[Optional[Path]]:
+        """
+        Fetch all images of an item concurrently (bounded). Order is preserved.
+        The returned files are pinned: pass them to release() when done.
+        """
+        semaphore = asyncio.Semaphore(max(1, settings.IMAGE_CACHE_PREFETCH_CONCURRENCY))
+
+        async def _one(key: str) -> Optional[Path]:
+            async with semaphore:
+                return await self.get_for_vision(key, pin=True)
+
+        return await asyncio.gather(*(_one(k) for k in keys))
+
+
+image_cache = ImageCache(
+    root=Path(settings.IMAGE_CACHE_DIR),
+    max_bytes=settings.IMAGE_CACHE_MB * 1024 * 1024,
+)
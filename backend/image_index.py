@@ -0,0 +1,119 @@
+"""
+Perceptual-hash index of item photos.
+
+Every item's photos are hashed (images.phash) and stored in image_hashes.
+When a new item comes in, its hashes are looked up among the same user's
+earlier items. Candidate rows are those sharing any 16-bit band with a query
+hash, which is exhaustive up to Hamming distance 3; exact distances are then
+computed here. An earlier item whose photos cover at least half of the new
+item's photos is a match, and its analysis can be reused
+(ITEM_REUSE=offer|auto, see api/routes.run_agent_pipeline and accept_reuse).
+"""
+from dataclasses import dataclass
+from typing import Optional
+
+import structlog
+from sqlalchemy import select, or_, delete
+
+from .config import settings
+from .images import hamming
+from .models.db import AsyncSessionLocal, DBImageHash, DBItem, ItemStatusEnum
+
+log = structlog.get_logger()
+
+_BANDS = 4
+_BAND_BITS = 16
+_BAND_MASK = (1 << _BAND_BITS) - 1
+
+# Items whose analysis is complete and can be reused
+_REUSABLE_STATUSES = (ItemStatusEnum.ready, ItemStatusEnum.listed, ItemStatusEnum.sold)
+
+
+@dataclass
+class ItemMatch:
+    item_id: int
+    matched: int      # how many of the new photos matched
+    distance: float   # mean Hamming distance of the matched photos
+
+
+def _bands(h: int) -> list[int]:
+    return [(h >> (i * _BAND_BITS)) & _BAND_MASK for i in range(_BANDS)]
+
+
+def _to_signed(h: int) -> int:
+    return h - (1 << 64) if h >= 1 << 63 else h
+
+
+def _to_unsigned(h: int) -> int:
+    return h & ((1 << 64) - 1)
+
+
+async def record_item_hashes(item_id: int, user_id: str, hashes: list[Optional[int]]):
+    """Replace the stored photo hashes of an item."""
+    hashes = [h for h in hashes if h is not None]
+    async with AsyncSessionLocal() as db:
+        await db.execute(delete(DBImageHash).where(DBImageHash.item_id == item_id))
+        db.add_all(
+            DBImageHash(
+                item_id=item_id,
+                user_id=user_id,
+                phash=_to_signed(h),
+                **{f"band{i}": b for i, b in enumerate(_bands(h))},
+            )
+            for h in hashes
+        )
+        await db.commit()
+
+
+async def find_similar_item(
+    user_id: str,
+    hashes: list[Optional[int]],
+    exclude_item_id: Optional[int] = None,
+) -> Optional[ItemMatch]:
+    """Best earlier item of this user whose photos match `hashes`, if any."""
+    hashes = [h for h in hashes if h is not None]
+    if not hashes:
+        return None
+    max_distance = min(settings.ITEM_REUSE_DISTANCE, _BANDS - 1)
+
+    band_filters = [
+        getattr(DBImageHash, f"band{i}").in_({_bands(h)[i] for h in hashes})
+        for i in range(_BANDS)
+    ]
+    query = (
+        select(DBImageHash.item_id, DBImageHash.phash)
+        .join(DBItem, DBItem.id == DBImageHash.item_id)
+        .where(
+            DBImageHash.user_id == user_id,
+            or_(*band_filters),
+            DBItem.status.in_(_REUSABLE_STATUSES),
+        )
+    )
+    if exclude_item_id is not None:
+        query = query.where(DBImageHash.item_id != exclude_item_id)
+
+    async with AsyncSessionLocal() as db:
+        rows = (await db.execute(query)).all()
+
+    # item_id → best distance per new photo
+    per_item: dict[int, dict[int, int]] = {}
+    for item_id, stored in rows:
+        stored = _to_unsigned(stored)
+        for idx, h in enumerate(hashes):
+            d = hamming(h, stored)
+            if d <= max_distance:
+                best = per_item.setdefault(item_id, {})
+                best[idx] = min(d, best.get(idx, d))
+
+    required = max(1, (len(hashes) + 1) // 2)
+    matches = [
+        ItemMatch(item_id=item_id, matched=len(best), distance=sum(best.values()) / len(best))
+        for item_id, best in per_item.items()
+        if len(best) >= required
+    ]
+    if not matches:
+        return None
+    # Most photos matched, then closest, then most recent
+    match = min(matches, key=lambda m: (-m.matched, m.distance, -m.item_id))
+    log.info("image_index.match", item_id=match.item_id, matched=match.matched, distance=match.distance)
+    return match
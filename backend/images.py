@@ -0,0 +1,325 @@
+"""
+Image derivative pipeline.
+
+Every uploaded photo gets a few resized WebP variants:
+  thumb   — dashboard / mobile grids
+  listing — item detail view and platform listings
+  vision  — what the intake agent sends to the vision model
+
+Decoding and resizing are CPU-bound, so they run in a process pool that is
+started in the app lifespan and never touch the event loop. Orientation is
+normalised from EXIF and all metadata (including GPS) is dropped from the
+variants. HEIC photos are supported when pillow-heif is installed.
+
+The same pool prepares photos for the vision model in two passes. The first
+downscales every photo, scores it for sharpness and information content (NumPy)
+and computes its difference hash; only (score, hash) comes back. The parent
+drops near-duplicates and keeps the best few, and only those are encoded, in a
+second pass, into base64 data URLs through a reused per-worker scratch buffer.
+So the event loop process holds one data URL per *kept* photo.
+
+phash() gives each item photo a DCT perceptual hash, stored per item so a
+relisted item can reuse an earlier analysis (see image_index.py).
+"""
+import io
+import math
+import mmap
+import asyncio
+import binascii
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Optional
+
+import structlog
+
+from .config import settings
+
+log = structlog.get_logger()
+
+# variant name → max(width, height) in pixels
+DERIVATIVES: dict[str, int] = {
+    "thumb": 320,
+    "listing": 1600,
+    "vision": 1536,
+}
+DERIVATIVE_FORMAT = "webp"
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def derivative_name(filename: str, variant: str) -> str:
+    """`abc.jpg` → `abc_thumb.webp`"""
+    return f"{Path(filename).stem}_{variant}.{DERIVATIVE_FORMAT}"
+
+
+def _register_heif():
+    try:
+        from pillow_heif import register_heif_opener  # type: ignore
+        register_heif_opener()
+    except ImportError:
+        pass
+
+
+def _render_derivatives(src: str, out_dir: str, sizes: dict[str, int]) -> dict[str, str]:
+    """
+    Runs in a worker process: decode `src` once, then write one WebP per size.
+    Returns {variant: output_path}.
+    """
+    from PIL import Image, ImageOps
+
+    _register_heif()
+    out: dict[str, str] = {}
+    with Image.open(src) as img:
+        img = ImageOps.exif_transpose(img)
+        if img.mode not in ("RGB", "RGBA"):
+            img = img.convert("RGBA" if "A" in img.getbands() else "RGB")
+        # Largest first so each step downsamples from the smallest sufficient image
+        for variant, max_dim in sorted(sizes.items(), key=lambda kv: -kv[1]):
+            img.thumbnail((max_dim, max_dim), Image.Resampling.LANCZOS)
+            dest = Path(out_dir) / derivative_name(src, variant)
+            # No exif= argument: metadata is not carried over to the variant
+            img.save(dest, format=DERIVATIVE_FORMAT, quality=settings.IMAGE_WEBP_QUALITY, method=4)
+            out[variant] = str(dest)
+    return out
+
+
+def init_pool():
+    """
+    Start the worker pool. Started even with IMAGE_DERIVATIVES=false: vision
+    preparation and photo hashing always run in it.
+    """
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=max(1, settings.IMAGE_WORKERS))
+        log.info("images.pool_started", workers=settings.IMAGE_WORKERS)
+
+
+def shutdown_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+        log.info("images.pool_stopped")
+
+
+async def render_derivatives(src: Path, out_dir: Path) -> dict[str, Path]:
+    """Generate all derivatives of a local image file in the process pool."""
+    init_pool()
+    loop = asyncio.get_running_loop()
+    result = await loop.run_in_executor(_pool, _render_derivatives, str(src), str(out_dir), DERIVATIVES)
+    return {variant: Path(p) for variant, p in result.items()}
+
+
+# ---------------------------------------------------------------------------
+# Vision preprocessing
+# ---------------------------------------------------------------------------
+
+def _gray(img, max_dim: int = 256):
+    import numpy as np
+    from PIL import Image
+
+    small = img.convert("L")
+    small.thumbnail((max_dim, max_dim), Image.Resampling.BILINEAR)
+    return np.asarray(small, dtype=np.float32)
+
+
+def _sharpness(gray) -> float:
+    """Variance of the 4-neighbour Laplacian — low for blurry photos."""
+    lap = (
+        gray[:-2, 1:-1] + gray[2:, 1:-1] + gray[1:-1, :-2] + gray[1:-1, 2:]
+        - 4 * gray[1:-1, 1:-1]
+    )
+    return float(lap.var()) if lap.size else 0.0
+
+
+def _entropy(gray) -> float:
+    """Shannon entropy of the grey-level histogram — low for blank/flat shots."""
+    import numpy as np
+
+    hist = np.bincount(gray.astype(np.uint8).ravel(), minlength=256).astype(np.float64)
+    p = hist[hist > 0] / hist.sum()
+    return float(-(p * np.log2(p)).sum())
+
+
+def dhash(img, size: int = 8) -> int:
+    """64-bit difference hash: near-identical photos differ in only a few bits."""
+    import numpy as np
+    from PIL import Image
+
+    g = np.asarray(img.convert("L").resize((size + 1, size), Image.Resampling.BILINEAR), dtype=np.int16)
+    bits = (g[:, 1:] > g[:, :-1]).ravel()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+def _dct_matrix(n: int):
+    import numpy as np
+
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    m = np.cos(np.pi * (2 * i + 1) * k / (2 * n)) * np.sqrt(2 / n)
+    m[0] /= np.sqrt(2)
+    return m
+
+
+def phash(img, size: int = 32, bits: int = 8) -> int:
+    """
+    64-bit DCT perceptual hash: the low-frequency 8x8 DCT coefficients of a
+    32x32 grey thumbnail, thresholded at their median. Survives re-encoding,
+    rescaling and small crops better than dhash.
+    """
+    import numpy as np
+    from PIL import Image
+
+    g = np.asarray(img.convert("L").resize((size, size), Image.Resampling.LANCZOS), dtype=np.float64)
+    c = _dct_matrix(size)
+    low = (c @ g @ c.T)[:bits, :bits].ravel()
+    return int.from_bytes(np.packbits(low > np.median(low[1:])).tobytes(), "big")
+
+
+def _image_phash(src: str) -> Optional[int]:
+    """Runs in a worker process."""
+    from PIL import Image, ImageOps, UnidentifiedImageError
+
+    _register_heif()
+    try:
+        with Image.open(src) as img:
+            img.draft("L", (256, 256))  # JPEG: decode at reduced scale
+            return phash(ImageOps.exif_transpose(img))
+    except (UnidentifiedImageError, OSError):
+        return None
+
+
+async def image_phashes(paths: list[str]) -> list[Optional[int]]:
+    """Perceptual hash of each local image (None where it cannot be decoded)."""
+    init_pool()
+    loop = asyncio.get_running_loop()
+    return list(await asyncio.gather(*(loop.run_in_executor(_pool, _image_phash, p) for p in paths)))
+
+
+# JPEG scratch buffer, reused across images. Per thread as well as per worker
+# process, so encodes can never share it if they run on a thread pool.
+_scratch = threading.local()
+
+_B64_STEP = 3 * 64 * 1024  # multiple of 3 so chunks encode without padding
+
+_API_MIMES = {"jpg": "image/jpeg", "jpeg": "image/jpeg", "png": "image/png", "webp": "image/webp", "gif": "image/gif"}
+
+
+def _data_url(mime: str, data: memoryview) -> str:
+    """Base64-encode `data` chunk by chunk into one pre-sized buffer."""
+    out = bytearray(4 * ((len(data) + 2) // 3))
+    pos = 0
+    for i in range(0, len(data), _B64_STEP):
+        enc = binascii.b2a_base64(data[i:i + _B64_STEP], newline=False)
+        out[pos:pos + len(enc)] = enc
+        pos += len(enc)
+    return f"data:{mime};base64,{out.decode('ascii')}"
+
+
+def _encode_original(src: str) -> Optional[str]:
+    """Fallback when Pillow cannot decode: memory-map and encode the file as-is."""
+    mime = _API_MIMES.get(Path(src).suffix.lower().lstrip("."))
+    if mime is None:
+        return None
+    with open(src, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+        with memoryview(m) as view:
+            return _data_url(mime, view)
+
+
+def _open_for_vision(src: str, max_dim: int):
+    """Decoded, orientation-normalised RGB copy of `src` downscaled to max_dim, or None."""
+    from PIL import Image, ImageOps, UnidentifiedImageError
+
+    _register_heif()
+    try:
+        with Image.open(src) as img:
+            img = ImageOps.exif_transpose(img).convert("RGB")
+    except (UnidentifiedImageError, OSError):
+        return None
+    img.thumbnail((max_dim, max_dim), Image.Resampling.LANCZOS)
+    return img
+
+
+def _score_vision_image(src: str, max_dim: int) -> Optional[dict]:
+    """Runs in a worker process: score and hash one downscaled photo (no encoding)."""
+    img = _open_for_vision(src, max_dim)
+    if img is None:
+        # Still sendable as-is if the API accepts the format; ranks last
+        if Path(src).suffix.lower().lstrip(".") not in _API_MIMES:
+            return None
+        return {"path": src, "score": 0.0, "dhash": None}
+    with img:
+        gray = _gray(img)
+        return {
+            "path": src,
+            "score": _entropy(gray) * math.log1p(_sharpness(gray)),
+            "dhash": dhash(img),
+        }
+
+
+def _encode_vision_image(src: str, max_dim: int) -> Optional[str]:
+    """Runs in a worker process: downscale and encode one selected photo as a JPEG data URL."""
+    img = _open_for_vision(src, max_dim)
+    if img is None:
+        return _encode_original(src)
+
+    buf = getattr(_scratch, "buf", None)
+    if buf is None:
+        buf = _scratch.buf = io.BytesIO()
+    buf.seek(0)
+    buf.truncate()
+    with img:
+        img.save(buf, format="JPEG", quality=85, optimize=True)
+    with buf.getbuffer() as view:
+        return _data_url("image/jpeg", view)
+
+
+async def prepare_vision_images(paths: list[str]) -> list[dict]:
+    """
+    Downscale, rank and de-duplicate photos for the vision model.
+    Returns at most VISION_MAX_IMAGES entries, best first, each with
+    `data_url` (base64 JPEG) and `detail` ("high" for the top
+    VISION_HIGH_DETAIL_IMAGES, "low" for the rest).
+    Only the selected photos are encoded.
+    """
+    init_pool()
+    loop = asyncio.get_running_loop()
+    max_dim = settings.VISION_MAX_DIM
+
+    async def _run(fn, path: str):
+        try:
+            return await loop.run_in_executor(_pool, fn, path, max_dim)
+        except Exception as e:
+            log.warning("images.vision_prepare_error", path=path, error=str(e))
+            return None
+
+    scored = [p for p in await asyncio.gather(*(_run(_score_vision_image, p) for p in paths)) if p]
+    scored.sort(key=lambda p: p["score"], reverse=True)
+
+    selected: list[dict] = []
+    for candidate in scored:
+        if candidate["dhash"] is not None and any(
+            s["dhash"] is not None and hamming(candidate["dhash"], s["dhash"]) <= settings.VISION_DUPLICATE_DISTANCE
+            for s in selected
+        ):
+            log.info("images.vision_duplicate_dropped", path=candidate["path"])
+            continue
+        selected.append(candidate)
+        if len(selected) >= settings.VISION_MAX_IMAGES:
+            break
+
+    data_urls = await asyncio.gather(*(_run(_encode_vision_image, s["path"]) for s in selected))
+    prepared = []
+    for s, data_url in zip(selected, data_urls):
+        if data_url is None:
+            continue
+        s["data_url"] = data_url
+        s["detail"] = "high" if len(prepared) < settings.VISION_HIGH_DETAIL_IMAGES else "low"
+        prepared.append(s)
+    log.info("images.vision_prepared", received=len(paths), selected=len(prepared))
+    return prepared
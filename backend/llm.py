@@ -0,0 +1,245 @@
+"""
+Process-wide registry of chat models.
+
+Every agent used to build its own ChatOpenAI per call, each with a fresh HTTP
+client, so no connection to the LLM endpoint was ever reused. Models are now
+cached by (model, temperature) and all of them share one pooled
+httpx.AsyncClient, opened in the app lifespan and closed on shutdown.
+
+invoke_structured binds a prompt to a Pydantic schema (OpenAI strict JSON
+schema when LLM_STRUCTURED_OUTPUT=true), validates the answer field by field,
+and re-asks only for the fields that failed instead of repeating the call.
+The first call can be streamed (on_text) for incremental UI updates.
+Per-schema parse-failure counters are kept in `structured_output_stats`.
+"""
+import json
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Optional, Type
+
+import httpx
+import structlog
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+from langchain_core.utils.function_calling import convert_to_openai_function
+from langchain_openai import ChatOpenAI
+from pydantic import BaseModel, TypeAdapter, ValidationError, create_model
+
+from .config import settings
+
+log = structlog.get_logger()
+
+_http_client: Optional[httpx.AsyncClient] = None
+_models: dict[tuple[str, float], ChatOpenAI] = {}
+
+
+def _client() -> httpx.AsyncClient:
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=settings.LLM_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.LLM_MAX_CONNECTIONS,
+            ),
+            timeout=httpx.Timeout(settings.LLM_TIMEOUT_S, connect=10.0),
+        )
+        _models.clear()  # models bound to a closed client must be rebuilt
+    return _http_client
+
+
+def get_chat_model(model: str, temperature: float = 0) -> ChatOpenAI:
+    """Return the shared ChatOpenAI for this model/temperature, creating it on first use."""
+    http_client = _client()
+    key = (model, float(temperature))
+    llm = _models.get(key)
+    if llm is None:
+        llm = ChatOpenAI(
+            model=model,
+            api_key=settings.OPENAI_API_KEY,
+            temperature=temperature,
+            http_async_client=http_client,
+        )
+        _models[key] = llm
+        log.info("llm.model_created", model=model, temperature=temperature)
+    return llm
+
+
+def init_llm():
+    """Open the shared HTTP client (called from the app lifespan)."""
+    _client()
+
+
+async def close_llm():
+    global _http_client
+    _models.clear()
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+        log.info("llm.client_closed")
+
+
+# ---------------------------------------------------------------------------
+# Structured output
+# ---------------------------------------------------------------------------
+
+@dataclass
+class StructuredResult:
+    value: Optional[dict]   # validated output (model_dump) or None
+    raw: str                # raw model text, for logging / refusal checks
+    refused: bool = False
+
+
+# schema name → {"calls", "first_pass_failures", "field_retries", "failures", "refusals"}
+structured_output_stats: dict[str, dict[str, int]] = {}
+
+
+def _count(name: str, counter: str):
+    stats = structured_output_stats.setdefault(
+        name, {"calls": 0, "first_pass_failures": 0, "field_retries": 0, "failures": 0, "refusals": 0}
+    )
+    stats[counter] += 1
+
+
+def parse_json_text(raw: str) -> Optional[dict]:
+    """Strip markdown fences and parse a JSON object. Returns None on failure."""
+    raw = raw.strip()
+    if raw.startswith("```"):
+        raw = raw.split("```", 2)[1]
+        if raw.startswith("json"):
+            raw = raw[4:]
+        raw = raw.rsplit("```", 1)[0].strip()
+    try:
+        data = json.loads(raw)
+    except json.JSONDecodeError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+def _validate_fields(schema: Type[BaseModel], data: dict) -> tuple[dict, list[str]]:
+    """Validate each field on its own; return (valid values, names of failed fields)."""
+    valid: dict[str, Any] = {}
+    failed: list[str] = []
+    for name, field in schema.model_fields.items():
+        if name not in data:
+            failed.append(name)
+            continue
+        try:
+            valid[name] = TypeAdapter(field.annotation).validate_python(data[name])
+        except ValidationError:
+            failed.append(name)
+    return valid, failed
+
+
+def _response_format(schema: Type[BaseModel]) -> dict:
+    fn = convert_to_openai_function(schema, strict=True)
+    return {"type": "json_schema", "json_schema": {"name": fn["name"], "schema": fn["parameters"], "strict": True}}
+
+
+async def _ask_streaming(
+    llm: ChatOpenAI,
+    messages: list[BaseMessage],
+    schema: Type[BaseModel],
+    on_text: Callable[[str], Awaitable[None]],
+) -> tuple[Optional[BaseModel], str, bool]:
+    """Like _ask, but streams the raw JSON text to `on_text` as it is generated."""
+    kwargs = {"response_format": _response_format(schema)} if settings.LLM_STRUCTURED_OUTPUT else {}
+    parts: list[str] = []
+    refused = False
+    async for chunk in llm.astream(messages, **kwargs):
+        refused = refused or bool(chunk.additional_kwargs.get("refusal"))
+        if isinstance(chunk.content, str) and chunk.content:
+            parts.append(chunk.content)
+            await on_text(chunk.content)
+    raw = "".join(parts).strip()
+    parsed = None
+    data = parse_json_text(raw)
+    if data is not None:
+        try:
+            parsed = schema.model_validate(data)
+        except ValidationError:
+            pass
+    return parsed, raw, refused
+
+
+async def _ask(
+    llm: ChatOpenAI,
+    messages: list[BaseMessage],
+    schema: Type[BaseModel],
+    is_refusal: Optional[Callable[[str], bool]] = None,
+    on_text: Optional[Callable[[str], Awaitable[None]]] = None,
+) -> tuple[Optional[BaseModel], str, bool]:
+    """One model call. Returns (parsed, raw_text, refused)."""
+    if on_text is not None:
+        parsed, raw, refused = await _ask_streaming(llm, messages, schema, on_text)
+    elif settings.LLM_STRUCTURED_OUTPUT:
+        bound = llm.with_structured_output(schema, method="json_schema", strict=True, include_raw=True)
+        result = await bound.ainvoke(messages)
+        raw_msg = result.get("raw")
+        raw = ((raw_msg.content if raw_msg is not None else "") or "").strip()
+        refused = bool(raw_msg is not None and raw_msg.additional_kwargs.get("refusal"))
+        parsed = result.get("parsed")
+    else:
+        response = await llm.ainvoke(messages)
+        raw, refused, parsed = (response.content or "").strip(), False, None
+    if parsed is None and is_refusal is not None and is_refusal(raw):
+        refused = True
+    return parsed, raw, refused
+
+
+async def invoke_structured(
+    llm: ChatOpenAI,
+    messages: list[BaseMessage],
+    schema: Type[BaseModel],
+    is_refusal: Optional[Callable[[str], bool]] = None,
+    on_text: Optional[Callable[[str], Awaitable[None]]] = None,
+) -> StructuredResult:
+    """
+    Call the model for a `schema`-shaped answer.
+    A response that fails validation is not thrown away: the valid fields are
+    kept and one follow-up asks only for the missing/invalid ones.
+    `is_refusal` lets the caller flag plain-text refusals, which are not retried.
+    `on_text`, if given, receives the raw JSON text of the first call as it
+    streams in; the returned value is still the validated result.
+    """
+    name = schema.__name__
+    _count(name, "calls")
+
+    parsed, raw, refused = await _ask(llm, messages, schema, is_refusal, on_text)
+    if refused:
+        _count(name, "refusals")
+        return StructuredResult(value=None, raw=raw, refused=True)
+    if parsed is not None:
+        return StructuredResult(value=parsed.model_dump(), raw=raw)
+
+    _count(name, "first_pass_failures")
+    valid, failed = _validate_fields(schema, parse_json_text(raw) or {})
+    if failed and len(failed) < len(schema.model_fields):
+        _count(name, "field_retries")
+        log.info("llm.structured_field_retry", schema=name, failed=failed)
+        fix_schema = create_model(
+            f"{name}Fix", **{f: (schema.model_fields[f].annotation, ...) for f in failed}
+        )
+        fix_messages = messages + [
+            AIMessage(content=raw),
+            HumanMessage(content=(
+                "These fields were missing or invalid: " + ", ".join(failed)
+                + ". Respond with JSON containing only these fields."
+            )),
+        ]
+        try:
+            fix_parsed, fix_raw, _ = await _ask(llm, fix_messages, fix_schema)
+            fixed = fix_parsed.model_dump() if fix_parsed is not None else parse_json_text(fix_raw) or {}
+            valid.update(fixed)
+        except Exception as e:
+            log.warning("llm.structured_retry_error", schema=name, error=str(e))
+
+    try:
+        return StructuredResult(value=schema.model_validate(valid).model_dump(), raw=raw)
+    except ValidationError:
+        _count(name, "failures")
+        stats = structured_output_stats[name]
+        log.warning(
+            "llm.structured_parse_failed",
+            schema=name,
+            raw=raw[:200],
+            failure_rate=round(stats["failures"] / stats["calls"], 3),
+        )
+        return StructuredResult(value=None, raw=raw)
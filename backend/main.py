@@ -2,15 +2,20 @@ import structlog
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
 from pathlib import Path
 
 from .config import settings
 from .models.db import Base, engine
+from .storage import init_storage, close_storage
+from .comparables_store import init_comparables_store
+from .images import init_pool as init_image_pool, shutdown_pool as shutdown_image_pool
+from .storage_gc import start_gc, stop_gc
+from .llm import init_llm, close_llm
 from .api.routes import router
 from .api.websocket import ws_router
 from .api.credentials_routes import creds_router
 from .api.device_routes import device_router
+from .api.static import UploadsStaticFiles
 
 log = structlog.get_logger()
 
@@ -20,8 +25,17 @@ async def lifespan(app: FastAPI):
     log.info("ernesto.startup", local_dev=settings.LOCAL_DEV, use_s3=settings.use_s3, use_redis=settings.use_redis)
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        await init_comparables_store(conn)
+    await init_storage()
+    init_image_pool()
+    start_gc()
+    init_llm()
     yield
     log.info("ernesto.shutdown")
+    await close_llm()
+    await stop_gc()
+    shutdown_image_pool()
+    await close_storage()
     await engine.dispose()
 
 
@@ -49,4 +63,4 @@ app.include_router(device_router)
 if not settings.use_s3:
     uploads_dir = Path("./uploads")
     uploads_dir.mkdir(exist_ok=True)
-    app.mount("/uploads", StaticFiles(directory=str(uploads_dir)), name="uploads")
+    app.mount("/uploads", UploadsStaticFiles(directory=str(uploads_dir)), name="uploads")
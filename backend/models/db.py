@@ -1,6 +1,6 @@
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
-from sqlalchemy import String, Float, DateTime, ForeignKey, Text, Enum as SAEnum, Boolean
+from sqlalchemy import String, Float, DateTime, ForeignKey, Text, Enum as SAEnum, Boolean, Integer, BigInteger, Index, UniqueConstraint
 from datetime import datetime, timezone
 from typing import Optional, List
 import enum
@@ -138,6 +138,7 @@ class DBItem(Base):
     user: Mapped["DBUser"] = relationship(back_populates="items")
     listings: Mapped[List["DBListing"]] = relationship(back_populates="item", cascade="all, delete-orphan")
     comparables: Mapped[List["DBComparable"]] = relationship(back_populates="item", cascade="all, delete-orphan")
+    image_hashes: Mapped[List["DBImageHash"]] = relationship(back_populates="item", cascade="all, delete-orphan")
 
 
 class DBListing(Base):
@@ -215,3 +216,63 @@ class DBComparable(Base):
     condition: Mapped[Optional[str]] = mapped_column(String(50))
 
     item: Mapped["DBItem"] = relationship(back_populates="comparables")
+
+
+class DBComparableListing(Base):
+    """
+    Shared, de-duplicated warehouse of sold comparables from every search.
+    Full-text indexed on title (see comparables_store.py).
+    """
+    __tablename__ = "comparable_listings"
+    __table_args__ = (UniqueConstraint("platform", "marketplace", "external_key"),)
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    platform: Mapped[str] = mapped_column(String(50))
+    marketplace: Mapped[str] = mapped_column(String(50))
+    external_key: Mapped[str] = mapped_column(String(500))  # listing URL, or a hash when there is none
+    title: Mapped[str] = mapped_column(String(300))
+    sold_price: Mapped[float] = mapped_column(Float)
+    url: Mapped[Optional[str]] = mapped_column(String(500))
+    condition: Mapped[Optional[str]] = mapped_column(String(50))
+    sold_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True))
+    fetched_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), index=True
+    )
+
+
+class DBStoredObject(Base):
+    """Reference count for content-addressed images (CONTENT_ADDRESSED_STORAGE=true)."""
+    __tablename__ = "stored_objects"
+
+    key: Mapped[str] = mapped_column(String(500), primary_key=True)
+    sha256: Mapped[str] = mapped_column(String(64), index=True)
+    size: Mapped[int] = mapped_column(Integer)
+    ref_count: Mapped[int] = mapped_column(Integer, default=0)
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), default=lambda: datetime.now(timezone.utc)
+    )
+    # Last upload that took a reference (the GC protects recent ones not yet attached to an item)
+    acquired_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), index=True
+    )
+
+
+class DBImageHash(Base):
+    """
+    64-bit perceptual hash of one item photo.
+    The hash is also split into four 16-bit bands: two hashes within Hamming
+    distance 3 always share at least one band, so band equality is the index.
+    """
+    __tablename__ = "image_hashes"
+    __table_args__ = tuple(Index(f"ix_image_hashes_user_band{i}", "user_id", f"band{i}") for i in range(4))
+
+    id: Mapped[int] = mapped_column(primary_key=True, index=True)
+    item_id: Mapped[int] = mapped_column(ForeignKey("items.id"), index=True)
+    user_id: Mapped[str] = mapped_column(String(128))
+    phash: Mapped[int] = mapped_column(BigInteger)  # stored signed
+    band0: Mapped[int] = mapped_column(Integer)
+    band1: Mapped[int] = mapped_column(Integer)
+    band2: Mapped[int] = mapped_column(Integer)
+    band3: Mapped[int] = mapped_column(Integer)
+
+    item: Mapped["DBItem"] = relationship(back_populates="image_hashes")
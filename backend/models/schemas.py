@@ -1,6 +1,7 @@
-from pydantic import BaseModel, ConfigDict
+import json
+from pydantic import BaseModel, ConfigDict, Field, computed_field
 from datetime import datetime
-from typing import Optional, List
+from typing import Optional, List, Literal
 from enum import Enum
 
 
@@ -42,6 +43,35 @@ class ItemCreate(BaseModel):
     image_paths: Optional[List[str]] = None
 
 
+class PresignFile(BaseModel):
+    filename: str
+    content_type: str = "image/jpeg"
+
+
+class PresignRequest(BaseModel):
+    files: List[PresignFile]
+
+
+class PresignedUpload(BaseModel):
+    key: str
+    url: str
+    fields: dict
+
+
+class BulkItemSpec(BaseModel):
+    """One entry of a bulk intake manifest."""
+    description: Optional[str] = None
+    platforms: List[str] = ["ebay"]
+    image_keys: List[str] = []  # already uploaded via /uploads/presign
+    files: List[int] = []       # indexes into the request's uploaded images
+
+
+class ItemImage(BaseModel):
+    url: str          # original upload
+    thumb_url: str    # grids (320 px WebP)
+    listing_url: str  # detail view (1600 px WebP)
+
+
 class Item(BaseModel):
     model_config = ConfigDict(from_attributes=True)
 
@@ -66,6 +96,36 @@ class Item(BaseModel):
     listings: List["Listing"] = []
     comparables: List["Comparable"] = []
 
+    @computed_field
+    @property
+    def images(self) -> List[ItemImage]:
+        """Public URLs of each photo and its resized derivatives (originals when derivatives are off)."""
+        # Imported here: storage imports models.db, whose package imports this module
+        from ..config import settings
+        from ..storage import get_image_url
+
+        try:
+            keys = json.loads(self.image_paths or "[]")
+        except json.JSONDecodeError:
+            return []
+        images = []
+        for key in keys:
+            url = get_image_url(key)
+            if settings.IMAGE_DERIVATIVES:
+                images.append(ItemImage(
+                    url=url,
+                    thumb_url=get_image_url(key, "thumb"),
+                    listing_url=get_image_url(key, "listing"),
+                ))
+            else:
+                images.append(ItemImage(url=url, thumb_url=url, listing_url=url))
+        return images
+
+
+class BulkIntakeResponse(BaseModel):
+    batch_id: str
+    items: List[Item]
+
 
 # --- Listing ---
 
@@ -173,3 +233,64 @@ class AgentState(BaseModel):
     awaiting_human: bool = False
     human_input: Optional[dict] = None
     platforms: List[Platform] = [Platform.ebay]
+
+
+# --- LLM output schemas (structured output, see llm.invoke_structured) ---
+# Every field is required (nullable where it may be unknown) so the schemas
+# are valid in OpenAI's strict JSON-schema mode.
+
+class IntakeItemData(BaseModel):
+    title: str
+    category: str
+    brand: Optional[str]
+    model: Optional[str]
+    condition: Literal["new", "like new", "excellent", "good", "fair", "poor"]
+    condition_notes: Optional[str]
+    color: Optional[str]
+    size: Optional[str]
+    key_features: List[str]
+    confidence: float
+
+
+# Listing copy is requested per platform: the agent combines only the parts it
+# needs into one schema, and the field descriptions become the prompt.
+
+class MasterCopy(BaseModel):
+    proposed_description: str = Field(description=(
+        "a clear, honest, buyer-friendly item description (plain text, 3-5 sentences). "
+        "This is the master description the seller will review and edit before publishing."
+    ))
+
+
+class EbayCopy(BaseModel):
+    ebay_title: str = Field(description="eBay-optimised title (keyword-rich, max 80 chars)")
+    ebay_description: str = Field(
+        description="eBay listing description (HTML allowed, 2-4 paragraphs, based on proposed_description)"
+    )
+
+
+class VintedCopy(BaseModel):
+    vinted_title: str = Field(description="Vinted-optimised title (casual, friendly, max 60 chars)")
+    vinted_description: str = Field(
+        description="Vinted description (conversational, 1-2 paragraphs, based on proposed_description)"
+    )
+
+
+PLATFORM_COPY_SCHEMAS: dict[str, type[BaseModel]] = {
+    "ebay": EbayCopy,
+    "vinted": VintedCopy,
+}
+
+
+class FallbackPrice(BaseModel):
+    """Asked for only when no priced comparable came back."""
+    suggested_price: Optional[float] = Field(
+        description="recommended asking price in EUR for this item in its condition, or null if you cannot tell"
+    )
+    price_rationale: str = Field(description="brief explanation of the price recommendation")
+
+
+class OfferRecommendation(BaseModel):
+    recommendation: Literal["accept", "decline", "counter"]
+    counter_price: Optional[float]
+    reasoning: str
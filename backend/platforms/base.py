@@ -51,6 +51,11 @@ class BasePlatformAdapter(ABC):
     @abstractmethod
     def platform_name(self) -> str: ...
 
+    @property
+    def marketplace(self) -> str:
+        """Market the adapter searches and lists on (part of the comparables cache key)."""
+        return "default"
+
     @abstractmethod
     async def post_listing(self, draft: ListingDraft) -> PublishedListing: ...
 
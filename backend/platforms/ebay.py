@@ -20,6 +20,7 @@ log = structlog.get_logger()
 
 EBAY_SANDBOX_BASE = "https://api.sandbox.ebay.com"
 EBAY_PROD_BASE = "https://api.ebay.com"
+EBAY_MARKETPLACE_ID = "EBAY_US"
 
 
 class EbayAdapter(BasePlatformAdapter):
@@ -37,12 +38,16 @@ class EbayAdapter(BasePlatformAdapter):
     def platform_name(self) -> str:
         return "ebay"
 
+    @property
+    def marketplace(self) -> str:
+        return f"{EBAY_MARKETPLACE_ID}{':sandbox' if self._sandbox else ''}"
+
     def _headers(self) -> dict:
         return {
             "Authorization": f"Bearer {self._token}",
             "Content-Type": "application/json",
             "Content-Language": "en-US",
-            "X-EBAY-C-MARKETPLACE-ID": "EBAY_US",
+            "X-EBAY-C-MARKETPLACE-ID": EBAY_MARKETPLACE_ID,
         }
 
     async def post_listing(self, draft: ListingDraft) -> PublishedListing:
@@ -235,8 +240,8 @@ class EbayAdapter(BasePlatformAdapter):
                 },
                 headers=self._headers(),
             )
-            if not resp.is_success:
-                return []
+            # Raise rather than return [] so a failed search is not cached as "no comparables"
+            resp.raise_for_status()
 
         items = resp.json().get("itemSummaries", [])
         return [
@@ -245,6 +250,8 @@ class EbayAdapter(BasePlatformAdapter):
                 "sold_price": float(i.get("price", {}).get("value", 0)),
                 "url": i.get("itemWebUrl"),
                 "condition": i.get("condition"),
+                # Browse search returns active listings: there is no sale date
+                "sold_at": None,
                 "platform": "ebay",
             }
             for i in items
@@ -0,0 +1,201 @@
+"""
+Price suggestions from sold comparables, vectorised with NumPy.
+
+Many items are priced in one call: their comparables are packed into a
+NaN-padded (items × comps) matrix and every step runs along axis 1.
+
+Per item:
+1. Comp prices are normalised to a new-condition equivalent using each comp's
+   own condition (unknown conditions are left as they are).
+2. Outliers are rejected on log prices, by MAD or IQR fences
+   (PRICING_OUTLIER_METHOD).
+3. Each remaining comp is weighted by how close its condition is to the
+   item's and, when it has a real sale date (sold_at), by recency (half-life
+   PRICING_RECENCY_HALF_LIFE_DAYS). Comps without one get full weight.
+4. The estimate is the weighted median, scaled back to the item's condition,
+   with a ~95% interval from the weighted spread and effective sample size.
+"""
+import warnings
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Optional
+
+import numpy as np
+
+from .config import settings
+
+CONDITION_MULTIPLIERS: dict[str, float] = {
+    "new": 1.0,
+    "like new": 0.90,
+    "excellent": 0.80,
+    "good": 0.70,
+    "fair": 0.55,
+    "poor": 0.35,
+}
+_DEFAULT_CONDITION = "good"
+
+_MAD_K = 3.0        # reject beyond K robust standard deviations
+_IQR_K = 1.5        # Tukey fences
+_CONDITION_SCALE = 0.2   # multiplier gap at which the condition weight falls to 1/e
+_UNKNOWN_CONDITION_WEIGHT = 0.6
+_Z = 1.96
+
+
+@dataclass
+class PriceEstimate:
+    price: float
+    low: float
+    high: float
+    comps_used: int
+    outliers: int
+
+
+def condition_multiplier(condition: Optional[str]) -> Optional[float]:
+    """Multiplier for a condition label (ours or a platform's), None if unknown."""
+    if not condition:
+        return None
+    c = condition.strip().lower().replace("-", " ")
+    if c in CONDITION_MULTIPLIERS:
+        return CONDITION_MULTIPLIERS[c]
+    if c.startswith("new"):          # "new with tags", "new other"
+        return CONDITION_MULTIPLIERS["new"]
+    for label in ("like new", "excellent", "good", "fair", "poor"):
+        if label in c:               # "very good", "used - good"
+            return CONDITION_MULTIPLIERS[label]
+    return None
+
+
+def parse_sold_at(value) -> Optional[datetime]:
+    """A comp's sold_at (datetime or ISO-8601 string, e.g. eBay's "…Z") as an aware datetime."""
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            return None
+    if not isinstance(value, datetime):
+        return None
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+def _sold_age_days(sold_at, now: datetime) -> float:
+    sold_at = parse_sold_at(sold_at)
+    if sold_at is None:
+        return np.nan
+    return max(0.0, (now - sold_at).total_seconds() / 86400)
+
+
+def _pack(comparables: list[list[dict]], now: datetime) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """(prices, comp condition multipliers, ages in days), NaN-padded to the longest list."""
+    width = max((len(c) for c in comparables), default=0) or 1
+    shape = (len(comparables), width)
+    prices = np.full(shape, np.nan)
+    mults = np.full(shape, np.nan)
+    ages = np.full(shape, np.nan)
+    for i, comps in enumerate(comparables):
+        for j, c in enumerate(comps):
+            price = c.get("sold_price") or 0
+            if price > 0:
+                prices[i, j] = price
+                mults[i, j] = condition_multiplier(c.get("condition")) or np.nan
+                ages[i, j] = _sold_age_days(c.get("sold_at"), now)
+    return prices, mults, ages
+
+
+def _outlier_mask(logp: np.ndarray, method: str) -> np.ndarray:
+    """True where a (non-NaN) log price is an outlier within its row."""
+    with np.errstate(invalid="ignore"), warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)  # all-NaN rows (items without comps)
+        if method == "iqr":
+            q1, q3 = np.nanpercentile(logp, [25, 75], axis=1, keepdims=True)
+            iqr = q3 - q1
+            return (logp < q1 - _IQR_K * iqr) | (logp > q3 + _IQR_K * iqr)
+        med = np.nanmedian(logp, axis=1, keepdims=True)
+        mad = 1.4826 * np.nanmedian(np.abs(logp - med), axis=1, keepdims=True)
+        # mad == 0 (most comps identical): nothing is rejected
+        return (mad > 0) & (np.abs(logp - med) > _MAD_K * mad)
+
+
+def _weighted_median(values: np.ndarray, weights: np.ndarray) -> np.ndarray:
+    """Row-wise weighted median; NaN values / zero weights are ignored."""
+    w = np.where(np.isnan(values), 0.0, weights)
+    order = np.argsort(np.where(np.isnan(values), np.inf, values), axis=1)
+    v = np.take_along_axis(values, order, axis=1)
+    cw = np.cumsum(np.take_along_axis(w, order, axis=1), axis=1)
+    total = cw[:, -1:]
+    idx = np.argmax(cw >= total / 2, axis=1)[:, None]
+    out = np.take_along_axis(v, idx, axis=1)[:, 0]
+    return np.where(total[:, 0] > 0, out, np.nan)
+
+
+def price_items(
+    comparables: list[list[dict]],
+    conditions: list[Optional[str]],
+    outlier_method: Optional[str] = None,
+    now: Optional[datetime] = None,
+) -> list[Optional[PriceEstimate]]:
+    """
+    Price many items at once. `comparables[i]` are item i's comps (dicts with
+    sold_price, optional condition and sold_at); `conditions[i]` its condition.
+    Returns one PriceEstimate per item, or None where no comp has a price.
+    """
+    if not comparables:
+        return []
+    now = now or datetime.now(timezone.utc)
+    prices, comp_mults, ages = _pack(comparables, now)
+    target = np.array([
+        condition_multiplier(c) or CONDITION_MULTIPLIERS[_DEFAULT_CONDITION] for c in conditions
+    ])[:, None]
+
+    # 1. New-condition equivalents, on a log scale
+    with np.errstate(invalid="ignore", divide="ignore"):
+        logp = np.log(prices / np.where(np.isnan(comp_mults), 1.0, comp_mults))
+
+    # 2. Outlier rejection (only rows with enough comps for a spread)
+    valid = ~np.isnan(logp)
+    enough = valid.sum(axis=1, keepdims=True) >= 4
+    outliers = _outlier_mask(logp, outlier_method or settings.PRICING_OUTLIER_METHOD) & valid & enough
+    logp = np.where(outliers, np.nan, logp)
+    kept = ~np.isnan(logp)
+
+    # 3. Condition-similarity × recency weights
+    cond_w = np.where(
+        np.isnan(comp_mults),
+        _UNKNOWN_CONDITION_WEIGHT,
+        np.exp(-np.abs(comp_mults - target) / _CONDITION_SCALE),
+    )
+    half_life = settings.PRICING_RECENCY_HALF_LIFE_DAYS
+    rec_w = np.where(np.isnan(ages), 1.0, 0.5 ** (np.nan_to_num(ages) / half_life))
+    w = np.where(kept, cond_w * rec_w, 0.0)
+
+    # 4. Weighted median and interval
+    centre = _weighted_median(logp, w)
+    wsum = w.sum(axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = np.nansum(w * np.nan_to_num(logp), axis=1) / wsum
+        var = np.nansum(w * (np.nan_to_num(logp) - mean[:, None]) ** 2, axis=1) / wsum
+        n_eff = wsum ** 2 / (w ** 2).sum(axis=1)
+        # standard error of a median ≈ 1.2533 × σ / √n
+        half_width = _Z * 1.2533 * np.sqrt(var) / np.sqrt(n_eff)
+
+    scale = target[:, 0]
+    price = np.exp(centre) * scale
+    low = np.exp(centre - half_width) * scale
+    high = np.exp(centre + half_width) * scale
+    used = kept.sum(axis=1)
+    rejected = outliers.sum(axis=1)
+
+    return [
+        PriceEstimate(
+            price=round(float(price[i]), 2),
+            low=round(float(low[i]), 2),
+            high=round(float(high[i]), 2),
+            comps_used=int(used[i]),
+            outliers=int(rejected[i]),
+        ) if used[i] else None
+        for i in range(len(comparables))
+    ]
+
+
+def price_item(comparables: list[dict], condition: Optional[str], **kwargs) -> Optional[PriceEstimate]:
+    """Single-item convenience wrapper around price_items()."""
+    return price_items([comparables], [condition], **kwargs)[0]
@@ -3,79 +3,565 @@ Storage abstraction.
 
 If S3_BUCKET is set: uploads go to S3, URLs served via CloudFront.
 Otherwise: falls back to local ./uploads/ directory (local dev).
+
+With CONTENT_ADDRESSED_STORAGE=true, keys are derived from the SHA-256 of the
+bytes: re-uploads of the same photo skip the write, and a reference count in
+the stored_objects table makes deletes safe.
+
+In S3 mode a single pooled client is opened in the app lifespan (init_storage /
+close_storage) and reused for every upload, download and delete.
+
+Uploads are streamed in chunks: each chunk is size-checked and hashed as it is
+read, and local disk writes run in a worker thread so large photos never block
+the event loop.
 """
+import os
 import uuid
+import base64
 import shutil
+import tempfile
+import asyncio
+import hashlib
 import structlog
+from contextlib import AsyncExitStack
+from dataclasses import dataclass
+from datetime import datetime, timezone
 from pathlib import Path
 from typing import Optional
 
 from fastapi import UploadFile
 
+from sqlalchemy import update, delete
+from sqlalchemy.exc import IntegrityError
+
 from .config import settings
+from .images import DERIVATIVES, DERIVATIVE_FORMAT, derivative_name, render_derivatives
+from .models.db import AsyncSessionLocal, DBStoredObject
 
 log = structlog.get_logger()
 
 LOCAL_UPLOAD_DIR = Path("./uploads")
 LOCAL_UPLOAD_DIR.mkdir(exist_ok=True)
 
+# Content-addressed objects never change, so clients may cache them forever.
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+_s3_client = None
+_s3_stack: Optional[AsyncExitStack] = None
+_s3_lock = asyncio.Lock()
+
+
+class UploadTooLargeError(ValueError):
+    """Raised when an upload exceeds the per-file or per-request size limit."""
+
+
+class InvalidUploadError(ValueError):
+    """Raised when a directly-uploaded key is missing or not owned by the user."""
+
+
+@dataclass
+class StoredImage:
+    key: str
+    sha256: str
+    size: int
+
+
+class UploadBudget:
+    """Byte budget shared by all images of a single request."""
+
+    def __init__(self, limit: Optional[int] = None):
+        self.limit = limit if limit is not None else settings.max_upload_request_bytes
+        self.used = 0
+
+    def consume(self, n: int):
+        self.used += n
+        if self.used > self.limit:
+            raise UploadTooLargeError(
+                f"Upload exceeds the {self.limit // (1024 * 1024)} MB per-request limit"
+            )
+
+
+class _IngestStream:
+    """
+    Async file-like wrapper around an UploadFile.
+    Enforces size limits and computes the SHA-256 in the same pass as the
+    bytes flow to their destination (local file or S3).
+    """
+
+    def __init__(self, file: UploadFile, budget: Optional[UploadBudget] = None):
+        self._file = file
+        self._budget = budget
+        self._hash = hashlib.sha256()
+        self.size = 0
+
+    async def read(self, n: int = -1) -> bytes:
+        if n is None or n < 0:
+            parts = []
+            while chunk := await self.read(settings.upload_chunk_bytes):
+                parts.append(chunk)
+            return b"".join(parts)
+
+        chunk = await self._file.read(n)
+        if chunk:
+            self.size += len(chunk)
+            if self.size > settings.max_upload_file_bytes:
+                raise UploadTooLargeError(
+                    f"{self._file.filename or 'Image'} exceeds the "
+                    f"{settings.MAX_UPLOAD_FILE_MB} MB per-file limit"
+                )
+            if self._budget:
+                self._budget.consume(len(chunk))
+            self._hash.update(chunk)
+        return chunk
+
+    async def drain(self):
+        """Consume the rest of the file, hashing and size-checking it."""
+        while await self.read(settings.upload_chunk_bytes):
+            pass
+
+    @property
+    def sha256(self) -> str:
+        return self._hash.hexdigest()
+
 
 # ---------------------------------------------------------------------------
 # Upload
 # ---------------------------------------------------------------------------
 
-async def upload_image(file: UploadFile, user_id: str) -> str:
+async def upload_image(
+    file: UploadFile,
+    user_id: str,
+    budget: Optional[UploadBudget] = None,
+) -> StoredImage:
     """
-    Upload an image and return a storage key/path.
-    In S3 mode: returns the S3 object key.
-    In local mode: returns the relative file path.
+    Stream an image to storage and return its key, content hash and size.
+    In S3 mode: the key is the S3 object key.
+    In local mode: the key is the relative file path.
+    Raises UploadTooLargeError if a size limit is hit mid-stream.
     """
     suffix = Path(file.filename).suffix.lower() if file.filename else ".jpg"
+    if settings.CONTENT_ADDRESSED_STORAGE:
+        return await _upload_content_addressed(file, user_id, suffix, budget)
+
     filename = f"{uuid.uuid4()}{suffix}"
+    stream = _IngestStream(file, budget)
 
     if settings.use_s3:
-        return await _upload_to_s3(file, user_id, filename)
+        key = await _upload_to_s3(stream, user_id, filename)
     else:
-        return await _upload_to_local(file, filename)
+        key = await _upload_to_local(stream, filename)
+    return StoredImage(key=key, sha256=stream.sha256, size=stream.size)
 
 
-async def _upload_to_s3(file: UploadFile, user_id: str, filename: str) -> str:
+async def upload_images(
+    files: list[UploadFile],
+    user_id: str,
+    budget: Optional[UploadBudget] = None,
+) -> list[StoredImage]:
+    """
+    Upload several images concurrently (bounded by UPLOAD_CONCURRENCY) under a
+    shared per-request budget. Results keep the order of `files`.
+    On the first failure the uploads still running or queued are cancelled,
+    the ones that succeeded are deleted and the error is re-raised, so a
+    failed request neither keeps uploading nor leaves orphaned objects.
+    """
+    if not files:
+        return []
+    budget = budget or UploadBudget()
+    semaphore = asyncio.Semaphore(max(1, settings.UPLOAD_CONCURRENCY))
+
+    async def _one(file: UploadFile) -> StoredImage:
+        async with semaphore:
+            return await upload_image(file, user_id, budget)
+
+    tasks = [asyncio.create_task(_one(f)) for f in files]
     try:
-        import aioboto3  # type: ignore
-    except ImportError:
-        log.error("storage.aioboto3_missing")
-        raise RuntimeError("aioboto3 is required for S3 storage. Run: pip install aioboto3")
+        done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+    except BaseException:
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+    failed = [t for t in done if not t.cancelled() and t.exception() is not None]
+    if not failed:
+        return [t.result() for t in tasks]
 
-    key = f"uploads/{user_id}/{filename}"
-    session = aioboto3.Session(
-        aws_access_key_id=settings.AWS_ACCESS_KEY_ID or None,
-        aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY or None,
-        region_name=settings.AWS_REGION,
+    for t in pending:
+        t.cancel()
+    await asyncio.gather(*pending, return_exceptions=True)
+    stored = [t.result() for t in tasks if t.done() and not t.cancelled() and t.exception() is None]
+    log.warning(
+        "storage.batch_upload_failed",
+        failed=len(failed), cancelled=len(pending), cleaning_up=len(stored),
     )
-    async with session.client("s3") as s3:
-        await s3.upload_fileobj(file.file, settings.S3_BUCKET, key)
-    log.info("storage.s3_upload", key=key)
+    await asyncio.gather(*(delete_image(s.key) for s in stored), return_exceptions=True)
+    # The first file (in request order) that failed
+    raise next(t for t in tasks if t in failed).exception()
+
+
+async def _upload_to_s3(stream: _IngestStream, user_id: str, filename: str) -> str:
+    key = f"uploads/{user_id}/{filename}"
+    s3 = await get_s3_client()
+    await s3.upload_fileobj(stream, settings.S3_BUCKET, key)
+    log.info("storage.s3_upload", key=key, size=stream.size)
     return key
 
 
-async def _upload_to_local(file: UploadFile, filename: str) -> str:
+async def _upload_to_local(stream: _IngestStream, filename: str) -> str:
     dest = LOCAL_UPLOAD_DIR / filename
-    with open(dest, "wb") as f:
-        shutil.copyfileobj(file.file, f)
-    log.info("storage.local_upload", path=str(dest))
+    # Write to a .part file and rename on success so readers never see a
+    # truncated image and aborted uploads leave nothing behind.
+    tmp = dest.with_name(dest.name + ".part")
+    f = await asyncio.to_thread(open, tmp, "wb")
+    try:
+        while chunk := await stream.read(settings.upload_chunk_bytes):
+            await asyncio.to_thread(f.write, chunk)
+    except BaseException:
+        await asyncio.to_thread(f.close)
+        tmp.unlink(missing_ok=True)
+        raise
+    await asyncio.to_thread(f.close)
+    await asyncio.to_thread(os.replace, tmp, dest)
+    log.info("storage.local_upload", path=str(dest), size=stream.size)
     return str(dest)
 
 
+async def _upload_content_addressed(
+    file: UploadFile,
+    user_id: str,
+    suffix: str,
+    budget: Optional[UploadBudget],
+) -> StoredImage:
+    # The reference is taken before looking for an existing object: once it is
+    # held, a concurrent delete_image of the same key keeps the object.
+    if settings.use_s3:
+        # The key depends on the hash, so hash the (already spooled) upload
+        # first, then PUT only if the object is not in the bucket yet.
+        hasher = _IngestStream(file, budget)
+        await hasher.drain()
+        stored = StoredImage(
+            key=f"uploads/{user_id}/{hasher.sha256}{suffix}", sha256=hasher.sha256, size=hasher.size
+        )
+        await _acquire_ref(stored)
+        try:
+            if await _s3_exists(stored.key):
+                log.info("storage.dedup_hit", key=stored.key)
+            else:
+                await file.seek(0)
+                s3 = await get_s3_client()
+                await s3.upload_fileobj(
+                    _IngestStream(file), settings.S3_BUCKET, stored.key,
+                    ExtraArgs={"CacheControl": IMMUTABLE_CACHE_CONTROL},
+                )
+                log.info("storage.s3_upload", key=stored.key, size=hasher.size)
+        except BaseException:
+            await _release_ref(stored.key)
+            raise
+        return stored
+
+    # Local: stream to a temp name while hashing, then move into place
+    # (or drop it if an identical file already exists).
+    stream = _IngestStream(file, budget)
+    tmp = await _upload_to_local(stream, f".ingest-{uuid.uuid4()}{suffix}")
+    dest = LOCAL_UPLOAD_DIR / f"{stream.sha256}{suffix}"
+    stored = StoredImage(key=str(dest), sha256=stream.sha256, size=stream.size)
+    try:
+        await _acquire_ref(stored)
+    except BaseException:
+        await asyncio.to_thread(Path(tmp).unlink, missing_ok=True)
+        raise
+    if dest.exists():
+        await asyncio.to_thread(Path(tmp).unlink, missing_ok=True)
+        log.info("storage.dedup_hit", path=str(dest))
+    else:
+        await asyncio.to_thread(os.replace, tmp, dest)
+    return stored
+
+
+async def _s3_exists(key: str) -> bool:
+    s3 = await get_s3_client()
+    try:
+        await s3.head_object(Bucket=settings.S3_BUCKET, Key=key)
+        return True
+    except s3.exceptions.ClientError as e:
+        if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+            return False
+        raise
+
+
+# ---------------------------------------------------------------------------
+# Direct-to-S3 uploads (presigned POST)
+# ---------------------------------------------------------------------------
+
+async def presign_upload(user_id: str, filename: str, content_type: str) -> dict:
+    """
+    Issue a presigned POST so the client uploads straight to S3.
+    The policy pins the key, the content type and the per-file size limit.
+    Returns {"key", "url", "fields"}.
+    """
+    if not settings.use_s3:
+        raise InvalidUploadError("Direct uploads require S3 storage")
+    if not content_type.startswith("image/"):
+        raise InvalidUploadError(f"Unsupported content type: {content_type}")
+
+    suffix = Path(filename).suffix.lower() or ".jpg"
+    key = f"uploads/{user_id}/{uuid.uuid4()}{suffix}"
+    s3 = await get_s3_client()
+    presigned = await s3.generate_presigned_post(
+        Bucket=settings.S3_BUCKET,
+        Key=key,
+        Fields={"Content-Type": content_type},
+        Conditions=[
+            {"Content-Type": content_type},
+            ["content-length-range", 1, settings.max_upload_file_bytes],
+        ],
+        ExpiresIn=settings.S3_PRESIGN_EXPIRES,
+    )
+    log.info("storage.presigned", key=key)
+    return {"key": key, **presigned}
+
+
+async def verify_upload(key: str, user_id: str) -> StoredImage:
+    """HEAD a directly-uploaded key and check it belongs to the user and fits the limits."""
+    if not settings.use_s3:
+        raise InvalidUploadError("Direct uploads require S3 storage")
+    if not key.startswith(f"uploads/{user_id}/") or ".." in key:
+        raise InvalidUploadError(f"Key not owned by user: {key}")
+
+    s3 = await get_s3_client()
+    try:
+        head = await s3.head_object(Bucket=settings.S3_BUCKET, Key=key, ChecksumMode="ENABLED")
+    except s3.exceptions.ClientError:
+        raise InvalidUploadError(f"Upload not found: {key}")
+
+    size = head["ContentLength"]
+    if size > settings.max_upload_file_bytes:
+        raise UploadTooLargeError(f"{key} exceeds the {settings.MAX_UPLOAD_FILE_MB} MB per-file limit")
+    # Only known if the client sent x-amz-checksum-sha256 with the upload
+    checksum = head.get("ChecksumSHA256")
+    sha256 = base64.b64decode(checksum).hex() if checksum else ""
+    return StoredImage(key=key, sha256=sha256, size=size)
+
+
+# ---------------------------------------------------------------------------
+# Reference counting (content-addressed mode)
+# ---------------------------------------------------------------------------
+
+async def _acquire_ref(stored: StoredImage):
+    """Increment the reference count for a content-addressed key."""
+    async with AsyncSessionLocal() as db:
+        for _ in range(2):
+            result = await db.execute(
+                update(DBStoredObject)
+                .where(DBStoredObject.key == stored.key)
+                .values(ref_count=DBStoredObject.ref_count + 1, acquired_at=datetime.now(timezone.utc))
+            )
+            if result.rowcount:
+                await db.commit()
+                return
+            db.add(DBStoredObject(key=stored.key, sha256=stored.sha256, size=stored.size, ref_count=1))
+            try:
+                await db.commit()
+                return
+            except IntegrityError:
+                # Another request inserted the row first — retry the increment
+                await db.rollback()
+
+
+async def _release_ref(key: str) -> bool:
+    """
+    Decrement the reference count for a key.
+    Returns True when the object is no longer referenced and may be deleted
+    (including keys that were never reference-counted).
+    The decrement is a single UPDATE … RETURNING, so concurrent releases
+    cannot both read the same count (row locks are a no-op on SQLite).
+    """
+    async with AsyncSessionLocal() as db:
+        remaining = (await db.execute(
+            update(DBStoredObject)
+            .where(DBStoredObject.key == key)
+            .values(ref_count=DBStoredObject.ref_count - 1)
+            .returning(DBStoredObject.ref_count)
+        )).scalar_one_or_none()
+        if remaining is None:
+            await db.commit()
+            return True
+        if remaining > 0:
+            await db.commit()
+            log.info("storage.ref_released", key=key, ref_count=remaining)
+            return False
+        # Only drop the row if nobody re-acquired it in the meantime
+        result = await db.execute(
+            delete(DBStoredObject).where(DBStoredObject.key == key, DBStoredObject.ref_count <= 0)
+        )
+        await db.commit()
+        return bool(result.rowcount)
+
+
+# ---------------------------------------------------------------------------
+# Delete
+# ---------------------------------------------------------------------------
+
+async def delete_image(key: str):
+    """
+    Delete a stored image. Missing objects are ignored.
+    Content-addressed objects are only removed once their last reference is released.
+    Resized derivatives are removed together with the original.
+    """
+    if not await _release_ref(key):
+        return
+    keys = [key] + [derivative_key(key, variant) for variant in DERIVATIVES]
+    if settings.use_s3:
+        for k in keys:
+            await _delete_from_s3(k)
+    else:
+        for k in keys:
+            await asyncio.to_thread(Path(k).unlink, missing_ok=True)
+        log.info("storage.local_delete", path=key)
+
+
+async def _delete_from_s3(key: str):
+    s3 = await get_s3_client()
+    await s3.delete_object(Bucket=settings.S3_BUCKET, Key=key)
+    log.info("storage.s3_delete", key=key)
+
+
+# ---------------------------------------------------------------------------
+# Download
+# ---------------------------------------------------------------------------
+
+async def download_image(key: str, dest: Path) -> Path:
+    """
+    Stream an S3 object to a local file (written via .part + rename).
+    In local mode the key is already a filesystem path and is returned as-is.
+    """
+    if not settings.use_s3:
+        return Path(key)
+
+    s3 = await get_s3_client()
+    resp = await s3.get_object(Bucket=settings.S3_BUCKET, Key=key)
+    tmp = dest.with_name(dest.name + ".part")
+    f = await asyncio.to_thread(open, tmp, "wb")
+    try:
+        async with resp["Body"] as body:
+            while chunk := await body.read(settings.upload_chunk_bytes):
+                await asyncio.to_thread(f.write, chunk)
+    except BaseException:
+        await asyncio.to_thread(f.close)
+        tmp.unlink(missing_ok=True)
+        raise
+    await asyncio.to_thread(f.close)
+    await asyncio.to_thread(os.replace, tmp, dest)
+    log.info("storage.s3_download", key=key, path=str(dest))
+    return dest
+
+
+# ---------------------------------------------------------------------------
+# Derivatives
+# ---------------------------------------------------------------------------
+
+def derivative_key(key: str, variant: str) -> str:
+    """Storage key of a resized variant, stored next to the original."""
+    return str(Path(key).with_name(derivative_name(key, variant)))
+
+
+async def create_derivatives(key: str) -> dict[str, str]:
+    """
+    Generate the thumb/listing/vision variants of a stored image.
+    Returns {variant: key}. Failures are logged and yield an empty dict so
+    callers can keep using the original.
+    """
+    if not settings.IMAGE_DERIVATIVES:
+        return {}
+    try:
+        if not settings.use_s3:
+            rendered = await render_derivatives(Path(key), Path(key).parent)
+            return {variant: str(p) for variant, p in rendered.items()}
+
+        workdir = Path(await asyncio.to_thread(tempfile.mkdtemp, prefix="ernesto-deriv-"))
+        try:
+            src = await download_image(key, workdir / Path(key).name)
+            rendered = await render_derivatives(src, workdir)
+            s3 = await get_s3_client()
+            keys: dict[str, str] = {}
+            for variant, path in rendered.items():
+                dkey = derivative_key(key, variant)
+                extra = {"ContentType": f"image/{DERIVATIVE_FORMAT}"}
+                if settings.CONTENT_ADDRESSED_STORAGE:
+                    extra["CacheControl"] = IMMUTABLE_CACHE_CONTROL
+                await s3.upload_file(str(path), settings.S3_BUCKET, dkey, ExtraArgs=extra)
+                keys[variant] = dkey
+            return keys
+        finally:
+            await asyncio.to_thread(shutil.rmtree, workdir, True)
+    except Exception as e:
+        log.warning("storage.derivatives_error", key=key, error=str(e))
+        return {}
+
+
+# ---------------------------------------------------------------------------
+# Shared S3 client
+# ---------------------------------------------------------------------------
+
+async def init_storage():
+    """Open the process-wide S3 client. No-op in local mode."""
+    if settings.use_s3:
+        await get_s3_client()
+
+
+async def close_storage():
+    """Close the shared S3 client and its connection pool."""
+    global _s3_client, _s3_stack
+    if _s3_stack is not None:
+        await _s3_stack.aclose()
+        log.info("storage.s3_client_closed")
+    _s3_client = None
+    _s3_stack = None
+
+
+async def get_s3_client():
+    """Return the shared S3 client, creating it on first use."""
+    global _s3_client, _s3_stack
+    if _s3_client is not None:
+        return _s3_client
+    async with _s3_lock:
+        if _s3_client is not None:
+            return _s3_client
+        try:
+            import aioboto3  # type: ignore
+            from botocore.config import Config  # type: ignore
+        except ImportError:
+            log.error("storage.aioboto3_missing")
+            raise RuntimeError("aioboto3 is required for S3 storage. Run: pip install aioboto3")
+
+        session = aioboto3.Session(
+            aws_access_key_id=settings.AWS_ACCESS_KEY_ID or None,
+            aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY or None,
+            region_name=settings.AWS_REGION,
+        )
+        stack = AsyncExitStack()
+        _s3_client = await stack.enter_async_context(session.client(
+            "s3",
+            config=Config(max_pool_connections=settings.S3_MAX_POOL_CONNECTIONS),
+        ))
+        _s3_stack = stack
+        log.info("storage.s3_client_ready", pool=settings.S3_MAX_POOL_CONNECTIONS)
+        return _s3_client
+
+
 # ---------------------------------------------------------------------------
 # URL resolution
 # ---------------------------------------------------------------------------
 
-def get_image_url(key: str) -> str:
+def get_image_url(key: str, variant: Optional[str] = None) -> str:
     """
     Resolve a storage key to a publicly accessible URL.
+    Pass `variant` ("thumb", "listing", "vision") for a resized derivative.
     In S3 mode: returns a CloudFront URL.
     In local mode: returns a path relative to the /uploads static mount.
     """
+    if variant:
+        key = derivative_key(key, variant)
     if settings.use_s3 and settings.CLOUDFRONT_DOMAIN:
         return f"https://{settings.CLOUDFRONT_DOMAIN}/{key}"
     if settings.use_s3:
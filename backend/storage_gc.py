@@ -0,0 +1,248 @@
+"""
+Storage garbage collector.
+
+Deleting an item removes its DB row but not its images. This job reclaims them:
+1. Stream every items.image_paths value from the DB into a set of referenced
+   keys, plus stored_objects keys acquired within GC_MIN_AGE_HOURS (uploaded
+   but possibly not attached to an item yet). Each key brings its resized
+   derivatives and the .br/.gz siblings served by api/static.py.
+2. Stream the object listing (S3 pages or a local directory scan).
+3. Delete anything unreferenced and older than GC_MIN_AGE_HOURS, in batches:
+   S3 DeleteObjects with up to 1000 keys per call, local unlinks in one worker
+   thread per batch. Stale stored_objects ref-count rows are dropped too.
+
+A content-addressed dedup hit reuses an old object without changing its age,
+but it does refresh stored_objects.acquired_at, so each batch is re-checked
+right before deleting: anything whose content hash was acquired recently
+(including during the run) is kept. Older reference counts are not trusted on
+their own — items.image_paths decides.
+
+Runs periodically in the app when GC_INTERVAL_HOURS > 0, or by hand:
+    python -m backend.storage_gc            # dry run — report only
+    python -m backend.storage_gc --delete   # actually delete
+"""
+import os
+import sys
+import json
+import asyncio
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import AsyncIterator, Optional
+
+import structlog
+from sqlalchemy import select, delete
+
+from .config import settings
+from .images import DERIVATIVES
+from .models.db import AsyncSessionLocal, DBItem, DBStoredObject
+from .storage import LOCAL_UPLOAD_DIR, derivative_key, get_s3_client
+
+log = structlog.get_logger()
+
+S3_DELETE_BATCH = 1000  # DeleteObjects hard limit
+_REPORT_SAMPLE = 20
+_PRECOMPRESSED_SUFFIXES = (".br", ".gz")  # served next to originals by api/static.py
+
+_gc_task: Optional[asyncio.Task] = None
+
+
+def _with_variants(key: str) -> list[str]:
+    """A key, its resized derivatives and the precompressed siblings of all of them."""
+    keys = [key, *(derivative_key(key, v) for v in DERIVATIVES)]
+    return keys + [k + ext for k in keys for ext in _PRECOMPRESSED_SUFFIXES]
+
+
+def _content_hash(key: str) -> Optional[str]:
+    """The SHA-256 a content-addressed key (or one of its variants) is named after, else None."""
+    name = Path(key).name
+    for ext in _PRECOMPRESSED_SUFFIXES:
+        name = name.removesuffix(ext)
+    stem = Path(name).stem
+    base, _, variant = stem.rpartition("_")
+    if base and variant in DERIVATIVES:
+        stem = base
+    return stem if len(stem) == 64 else None
+
+
+async def _referenced_keys(acquired_since: datetime) -> set[str]:
+    referenced: set[str] = set()
+    async with AsyncSessionLocal() as db:
+        rows = await db.stream_scalars(
+            select(DBItem.image_paths)
+            .where(DBItem.image_paths.is_not(None))
+            .execution_options(yield_per=500)
+        )
+        async for raw in rows:
+            try:
+                keys = json.loads(raw)
+            except (TypeError, json.JSONDecodeError):
+                continue
+            for key in keys:
+                referenced.update(_with_variants(key))
+
+        # Recently uploaded (and ref-counted), maybe not attached to an item yet
+        live = await db.stream_scalars(
+            select(DBStoredObject.key)
+            .where(DBStoredObject.ref_count > 0, DBStoredObject.acquired_at >= acquired_since)
+            .execution_options(yield_per=500)
+        )
+        async for key in live:
+            referenced.update(_with_variants(key))
+    return referenced
+
+
+async def _newly_referenced(keys: list[str], acquired_since: datetime) -> set[str]:
+    """Keys of `keys` whose content hash has been acquired since `acquired_since`."""
+    hashes = {h for h in map(_content_hash, keys) if h}
+    if not hashes:
+        return set()
+    async with AsyncSessionLocal() as db:
+        live = set((await db.scalars(
+            select(DBStoredObject.sha256)
+            .where(
+                DBStoredObject.sha256.in_(hashes),
+                DBStoredObject.ref_count > 0,
+                DBStoredObject.acquired_at >= acquired_since,
+            )
+        )).all())
+    return {k for k in keys if _content_hash(k) in live}
+
+
+async def _list_objects(cutoff: float) -> AsyncIterator[tuple[str, int]]:
+    """Yield (key, size) for stored objects last modified before `cutoff`."""
+    if settings.use_s3:
+        s3 = await get_s3_client()
+        paginator = s3.get_paginator("list_objects_v2")
+        async for page in paginator.paginate(Bucket=settings.S3_BUCKET, Prefix="uploads/"):
+            for obj in page.get("Contents", []):
+                if obj["LastModified"].timestamp() < cutoff:
+                    yield obj["Key"], obj["Size"]
+        return
+
+    def _scan() -> list[tuple[str, int]]:
+        out = []
+        with os.scandir(LOCAL_UPLOAD_DIR) as it:
+            for entry in it:
+                # Skip .gitkeep, in-progress .part files and .ingest-* temp files
+                if entry.name.startswith(".") or entry.name.endswith(".part") or not entry.is_file():
+                    continue
+                st = entry.stat()
+                if st.st_mtime < cutoff:
+                    out.append((str(LOCAL_UPLOAD_DIR / entry.name), st.st_size))
+        return out
+
+    for item in await asyncio.to_thread(_scan):
+        yield item
+
+
+async def _delete_batch(keys: list[str], acquired_since: datetime) -> int:
+    """Delete a batch, minus keys that gained a reference since the snapshot. Returns the count deleted."""
+    kept = await _newly_referenced(keys, acquired_since)
+    if kept:
+        log.info("storage_gc.kept_in_use", count=len(kept))
+        keys = [k for k in keys if k not in kept]
+    if not keys:
+        return 0
+
+    if settings.use_s3:
+        s3 = await get_s3_client()
+        resp = await s3.delete_objects(
+            Bucket=settings.S3_BUCKET,
+            Delete={"Objects": [{"Key": k} for k in keys], "Quiet": True},
+        )
+        for err in resp.get("Errors", []):
+            log.warning("storage_gc.delete_error", key=err.get("Key"), error=err.get("Message"))
+    else:
+        def _unlink_all():
+            for k in keys:
+                Path(k).unlink(missing_ok=True)
+        await asyncio.to_thread(_unlink_all)
+
+    async with AsyncSessionLocal() as db:
+        await db.execute(delete(DBStoredObject).where(DBStoredObject.key.in_(keys)))
+        await db.commit()
+    return len(keys)
+
+
+async def collect_garbage(dry_run: bool = True) -> dict:
+    """
+    Find (and unless dry_run, delete) unreferenced images.
+    Returns a report: counts, reclaimable bytes and a sample of orphaned keys.
+    """
+    started = time.monotonic()
+    cutoff = time.time() - settings.GC_MIN_AGE_HOURS * 3600
+    acquired_since = datetime.fromtimestamp(cutoff, timezone.utc)
+    referenced = await _referenced_keys(acquired_since)
+
+    scanned = orphaned = deleted = orphaned_bytes = 0
+    sample: list[str] = []
+    batch: list[str] = []
+    async for key, size in _list_objects(cutoff):
+        scanned += 1
+        if key in referenced:
+            continue
+        orphaned += 1
+        orphaned_bytes += size
+        if len(sample) < _REPORT_SAMPLE:
+            sample.append(key)
+        if dry_run:
+            continue
+        batch.append(key)
+        if len(batch) >= S3_DELETE_BATCH:
+            deleted += await _delete_batch(batch, acquired_since)
+            batch = []
+    if batch:
+        deleted += await _delete_batch(batch, acquired_since)
+
+    report = {
+        "dry_run": dry_run,
+        "referenced": len(referenced),
+        "scanned": scanned,
+        "orphaned": orphaned,
+        "orphaned_bytes": orphaned_bytes,
+        "deleted": deleted,
+        "sample": sample,
+        "seconds": round(time.monotonic() - started, 2),
+    }
+    log.info("storage_gc.complete", **{k: v for k, v in report.items() if k != "sample"})
+    return report
+
+
+async def _gc_loop():
+    while True:
+        await asyncio.sleep(settings.GC_INTERVAL_HOURS * 3600)
+        try:
+            await collect_garbage(dry_run=settings.GC_DRY_RUN)
+        except Exception as e:
+            log.warning("storage_gc.error", error=str(e))
+
+
+def start_gc():
+    """Start the periodic GC task (no-op when GC_INTERVAL_HOURS is 0)."""
+    global _gc_task
+    if settings.GC_INTERVAL_HOURS > 0 and _gc_task is None:
+        _gc_task = asyncio.create_task(_gc_loop())
+
+
+async def stop_gc():
+    global _gc_task
+    if _gc_task is not None:
+        _gc_task.cancel()
+        try:
+            await _gc_task
+        except asyncio.CancelledError:
+            pass
+        _gc_task = None
+
+
+if __name__ == "__main__":
+    async def _main():
+        from .storage import close_storage
+        try:
+            report = await collect_garbage(dry_run="--delete" not in sys.argv)
+            print(json.dumps(report, indent=2))
+        finally:
+            await close_storage()
+
+    asyncio.run(_main())
@@ -6,14 +6,16 @@ import type { Item } from "../types";
 
 interface Props {
   item: Item;
+  // Streamed proposal, used until the saved one arrives
+  draftDescription?: string;
 }
 
-export function ApprovalPanel({ item }: Props) {
+export function ApprovalPanel({ item, draftDescription }: Props) {
   const [finalPrice, setFinalPrice] = useState(
     item.suggested_price?.toFixed(2) ?? ""
   );
   const [description, setDescription] = useState(
-    item.proposed_description ?? ""
+    item.proposed_description || draftDescription || ""
   );
   const qc = useQueryClient();
 
@@ -24,10 +24,7 @@ function StatCard({ label, value, icon: Icon, color }: {
 }
 
 function ItemRow({ item }: { item: Item }) {
-  const images: string[] = (() => {
-    try { return JSON.parse(item.image_paths || "[]"); } catch { return []; }
-  })();
-  const thumb = images[0];
+  const thumb = item.images[0];
 
   return (
     <Link
@@ -36,7 +33,17 @@ function ItemRow({ item }: { item: Item }) {
     >
       <div className="w-14 h-14 rounded-lg bg-slate-800 overflow-hidden flex-shrink-0">
         {thumb ? (
-          <img src={`/uploads/${thumb.split("/").pop()}`} alt="" className="w-full h-full object-cover" />
+          <img
+            src={thumb.thumb_url}
+            alt=""
+            loading="lazy"
+            className="w-full h-full object-cover"
+            onError={(e) => {
+              // Derivative not generated (yet) — fall back to the original once
+              const img = e.currentTarget;
+              if (!img.dataset.fallback) { img.dataset.fallback = "1"; img.src = thumb.url; }
+            }}
+          />
         ) : (
           <div className="w-full h-full flex items-center justify-center text-slate-600">
             <Package className="w-6 h-6" />
@@ -1,6 +1,7 @@
+import { useState } from "react";
 import { useParams, Link } from "react-router-dom";
 import { useQuery, useMutation, useQueryClient } from "@tanstack/react-query";
-import { ArrowLeft, ExternalLink, MessageSquare, Tag, AlertTriangle, XCircle } from "lucide-react";
+import { ArrowLeft, ExternalLink, MessageSquare, Tag, AlertTriangle, XCircle, FileText } from "lucide-react";
 import { itemsApi } from "../lib/api";
 import { StatusBadge } from "../components/StatusBadge";
 import { PlatformBadge } from "../components/PlatformIcon";
@@ -14,6 +15,8 @@ export function ItemDetail() {
   const { id } = useParams<{ id: string }>();
   const itemId = parseInt(id!, 10);
   const qc = useQueryClient();
+  // Proposed description as it is being written by the listing agent
+  const [draftDescription, setDraftDescription] = useState("");
 
   const delistMutation = useMutation({
     mutationFn: (listingId: number) => itemsApi.delist(listingId),
@@ -44,6 +47,9 @@ export function ItemDetail() {
   });
 
   useItemSocket(itemId, (event: AgentEvent) => {
+    if (event.type === "proposed_description") {
+      setDraftDescription((prev) => prev.slice(0, event.offset ?? prev.length) + (event.chunk ?? ""));
+    }
     if (event.type === "step") {
       qc.invalidateQueries({ queryKey: ["item", itemId] });
       qc.invalidateQueries({ queryKey: ["offers", itemId] });
@@ -70,9 +76,7 @@ export function ItemDetail() {
     );
   }
 
-  const images: string[] = (() => {
-    try { return JSON.parse(item.image_paths || "[]"); } catch { return []; }
-  })();
+  const images = item.images;
 
   const analysis = (() => {
     try { return JSON.parse(item.ai_analysis || "{}"); } catch { return {}; }
@@ -99,8 +103,18 @@ export function ItemDetail() {
       {/* Timeline */}
       <AgentTimeline status={item.status} />
 
+      {/* Description being written (streamed before the listing is ready) */}
+      {item.status === "analyzing" && draftDescription && (
+        <div className="card space-y-2">
+          <h3 className="font-medium text-sm text-slate-400 flex items-center gap-1.5">
+            <FileText className="w-3.5 h-3.5 text-brand-400" /> Writing description…
+          </h3>
+          <p className="text-sm text-slate-300 leading-relaxed whitespace-pre-wrap">{draftDescription}</p>
+        </div>
+      )}
+
       {/* Approval panel */}
-      {item.status === "ready" && <ApprovalPanel item={item} />}
+      {item.status === "ready" && <ApprovalPanel item={item} draftDescription={draftDescription} />}
 
       {/* Pending offer alert */}
       {pendingOffers.length > 0 && (
@@ -118,13 +132,20 @@ export function ItemDetail() {
           <div className="card space-y-3">
             <h3 className="font-medium text-sm text-slate-400">Photos</h3>
             <div className="grid grid-cols-3 gap-2">
-              {images.map((path, i) => (
-                <img
-                  key={i}
-                  src={`/uploads/${path.split("/").pop()}`}
-                  alt=""
-                  className="w-full aspect-square object-cover rounded-lg bg-slate-800"
-                />
+              {images.map((image, i) => (
+                <a key={i} href={image.listing_url} target="_blank" rel="noreferrer">
+                  <img
+                    src={image.thumb_url}
+                    alt=""
+                    loading="lazy"
+                    className="w-full aspect-square object-cover rounded-lg bg-slate-800"
+                    onError={(e) => {
+                      // Derivative not generated (yet) — fall back to the original once
+                      const img = e.currentTarget;
+                      if (!img.dataset.fallback) { img.dataset.fallback = "1"; img.src = image.url; }
+                    }}
+                  />
+                </a>
               ))}
             </div>
           </div>
@@ -62,6 +62,12 @@ export interface Listing {
   messages: Message[];
 }
 
+export interface ItemImage {
+  url: string;
+  thumb_url: string;
+  listing_url: string;
+}
+
 export interface Item {
   id: number;
   title?: string;
@@ -75,6 +81,7 @@ export interface Item {
   user_description?: string;
   proposed_description?: string;
   image_paths?: string;
+  images: ItemImage[];
   suggested_price?: number;
   final_price?: number;
   status: ItemStatus;
@@ -86,8 +93,12 @@ export interface Item {
 }
 
 export interface AgentEvent {
-  type: "step" | "resumed" | "error";
+  type: "step" | "resumed" | "error" | "proposed_description";
   step?: string;
   item_id: number;
   data?: Record<string, unknown>;
+  // proposed_description: streamed text, spliced in at `offset` (UTF-16 code units)
+  chunk?: string;
+  offset?: number;
+  done?: boolean;
 }